@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from logger_setup import log_message
+import config
+import filesystem
+
+def _cache_dir():
+    return filesystem.get_app_data_dir(os.path.join(config.CACHE_SUBDIR, config.ARTIFACT_CACHE_SUBDIR))
+
+def _load_index():
+    try:
+        with open(os.path.join(_cache_dir(), 'index.json'), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if isinstance(index, dict) and isinstance(index.get('entries'), dict): return index
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log_message(f"Не удалось прочитать индекс кеша архивов: {e}", 'debug')
+    return {'entries': {}, 'hits': 0, 'misses': 0}
+
+def _save_index(index):
+    try:
+        index_path = os.path.join(_cache_dir(), 'index.json')
+        with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(index_path + '.tmp', index_path)
+    except Exception as e:
+        log_message(f"Не удалось сохранить индекс кеша архивов: {e}", 'debug')
+
+def _sha256_of(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(config.DOWNLOAD_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def _blob_path(sha256):
+    return os.path.join(_cache_dir(), sha256)
+
+def _drop_entry(index, key):
+    # Файлы адресуются по содержимому: один файл может принадлежать нескольким ключам
+    entry = index['entries'].pop(key, None)
+    if entry and not any(e['sha256'] == entry['sha256'] for e in index['entries'].values()):
+        try: os.remove(_blob_path(entry['sha256']))
+        except OSError: pass
+
+def _log_counters(index, result):
+    log_message(f"Кеш архивов: {result} (попаданий: {index['hits']}, промахов: {index['misses']}).")
+
+def get_cached_artifact(repo_name, tag, asset_name, target_path, expected_sha256=None):
+    index = _load_index()
+    key = f"{repo_name}/{tag}/{asset_name}"
+    entry = index['entries'].get(key)
+    if entry and expected_sha256 and entry['sha256'] != expected_sha256.lower():
+        log_message(f"Архив {asset_name} в кеше не совпадает с опубликованной контрольной суммой.", 'warning')
+        _drop_entry(index, key)
+        entry = None
+    if entry:
+        blob_path = _blob_path(entry['sha256'])
+        try:
+            if _sha256_of(blob_path) == entry['sha256']:
+                if os.path.exists(target_path): os.remove(target_path)
+                shutil.copyfile(blob_path, target_path)
+                entry['last_used'] = time.time()
+                index['hits'] += 1
+                _log_counters(index, f"{asset_name} взят из кеша, скачивание не требуется")
+                _save_index(index)
+                return True
+            log_message(f"Архив {asset_name} в кеше поврежден, удаляю.", 'warning')
+        except OSError as e:
+            log_message(f"Не удалось взять {asset_name} из кеша: {e}", 'warning')
+        _drop_entry(index, key)
+    index['misses'] += 1
+    _log_counters(index, f"{asset_name} нет в кеше")
+    _save_index(index)
+    return False
+
+def drop_artifact(repo_name, tag, asset_name):
+    # Архив из кеша оказался непригоден (например, ошибка CRC при распаковке) - в следующий раз он будет скачан заново
+    index = _load_index()
+    key = f"{repo_name}/{tag}/{asset_name}"
+    if key not in index['entries']: return
+    _drop_entry(index, key)
+    _save_index(index)
+    log_message(f"Архив {asset_name} удален из кеша.", 'debug')
+
+def store_artifact(repo_name, tag, asset_name, source_path):
+    if config.ARTIFACT_CACHE_MAX_BYTES <= 0: return
+    try:
+        size = os.path.getsize(source_path)
+        if size > config.ARTIFACT_CACHE_MAX_BYTES: return
+        sha256 = _sha256_of(source_path)
+        blob_path = _blob_path(sha256)
+        if not os.path.exists(blob_path):
+            shutil.copyfile(source_path, blob_path + '.tmp')
+            os.replace(blob_path + '.tmp', blob_path)
+    except OSError as e:
+        log_message(f"Не удалось сохранить {asset_name} в кеш архивов: {e}", 'warning')
+        return
+
+    index = _load_index()
+    key = f"{repo_name}/{tag}/{asset_name}"
+    index['entries'][key] = {'sha256': sha256, 'size': size, 'last_used': time.time()}
+    # Вытесняем давно не использованные архивы, пока кеш не уложится в лимит
+    while True:
+        blobs = {e['sha256']: e['size'] for e in index['entries'].values()}
+        if sum(blobs.values()) <= config.ARTIFACT_CACHE_MAX_BYTES: break
+        oldest_key = min((k for k in index['entries'] if k != key), key=lambda k: index['entries'][k]['last_used'], default=None)
+        if oldest_key is None: break
+        log_message(f"Удаляю из кеша архивов давно не использованный {oldest_key}.", 'debug')
+        _drop_entry(index, oldest_key)
+    _save_index(index)
+    log_message(f"Архив {asset_name} сохранен в кеш.", 'debug')
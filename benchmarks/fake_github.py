@@ -0,0 +1,153 @@
+import hashlib
+import json
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Локальная заглушка GitHub: отдает JSON релизов и архивы с поддержкой Range, ETag и заголовков X-RateLimit.
+# latency - задержка перед каждым ответом (сек), throughput - скорость отдачи на одно соединение (байт/сек, 0 - без ограничения).
+# Для проверки докачки: drop_after/drops - оборвать следующие drops ответов с файлом после drop_after байт тела,
+# ignore_range - отвечать 200 с полным файлом на запросы с Range
+
+_RELEASE_PATH_RE = re.compile(r'^/repos/([^/]+/[^/]+)/releases/(latest|tags/(.+))$')
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_SEND_CHUNK = 64 * 1024
+
+class FakeGithubServer:
+    def __init__(self, latency=0.0, throughput=0, rate_limit=5000):
+        self.latency = latency
+        self.throughput = throughput
+        self.rate_limit = rate_limit
+        self.releases = {} # {repo: [данные релиза]}, первый - последний релиз
+        self.assets = {}   # {путь: (данные, etag)}
+        self.drop_after = 0
+        self.drops = 0
+        self.ignore_range = False
+        self.lock = threading.Lock()
+        self.requests = []
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def add_asset(self, path, data):
+        # Файл, отдаваемый по path (с Range и ETag); возвращает полный URL
+        self.assets[path] = (data, f'"{hashlib.sha256(data).hexdigest()[:16]}"')
+        return self.url + path
+
+    def add_release(self, repo, tag, assets, digest=True):
+        # assets - {имя файла: bytes}; к каждому архиву публикуется digest, как это делает GitHub
+        # (digest=False - как у старых релизов, где контрольной суммы нет)
+        release_assets = []
+        for name, data in assets.items():
+            path = f"/{repo}/releases/download/{tag}/{name}"
+            asset = {'name': name, 'browser_download_url': self.add_asset(path, data), 'size': len(data)}
+            if digest: asset['digest'] = f"sha256:{hashlib.sha256(data).hexdigest()}"
+            release_assets.append(asset)
+        self.releases.setdefault(repo, []).insert(0, {'tag_name': tag, 'assets': release_assets, 'body': ''})
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-github", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reset_stats(self):
+        with self.lock: self.requests = []
+
+    def _find_release(self, repo, which, tag):
+        releases = self.releases.get(repo, [])
+        if which == 'latest': return releases[0] if releases else None
+        return next((release for release in releases if release['tag_name'] == tag), None)
+
+def _make_handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _headers(self, code, length, extra):
+            self.send_response(code)
+            self.send_header('Content-Length', str(length))
+            for key, value in extra.items(): self.send_header(key, value)
+            self.end_headers()
+
+        def _write(self, body):
+            if not server.throughput:
+                self.wfile.write(body)
+                return
+            started = time.perf_counter()
+            for offset in range(0, len(body), _SEND_CHUNK):
+                self.wfile.write(body[offset:offset + _SEND_CHUNK])
+                ahead = (offset + _SEND_CHUNK) / server.throughput - (time.perf_counter() - started)
+                if ahead > 0: time.sleep(ahead)
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            with server.lock: server.requests.append((self.command, self.path, self.headers.get('Range')))
+            if server.latency: time.sleep(server.latency)
+            match = _RELEASE_PATH_RE.match(self.path)
+            if match: return self._send_release(*match.groups())
+            if self.path in server.assets: return self._send_asset(*server.assets[self.path])
+            self._send_json(404, {'message': 'Not Found'})
+
+        def _send_json(self, code, data, extra=None):
+            body = json.dumps(data).encode('utf-8')
+            headers = {'Content-Type': 'application/json; charset=utf-8', 'X-RateLimit-Limit': str(server.rate_limit),
+                       'X-RateLimit-Remaining': str(server.rate_limit - 1), 'X-RateLimit-Reset': str(int(time.time()) + 3600)}
+            headers.update(extra or {})
+            self._headers(code, len(body), headers)
+            if self.command != 'HEAD': self.wfile.write(body)
+
+        def _send_release(self, repo, which, tag):
+            release = server._find_release(repo, which, tag)
+            if release is None: return self._send_json(404, {'message': 'Not Found'})
+            etag = '"' + hashlib.sha1(release['tag_name'].encode('utf-8')).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self._headers(304, 0, {'ETag': etag})
+                return
+            self._send_json(200, release, {'ETag': etag})
+
+        def _send_asset(self, data, etag):
+            headers = {'Content-Type': 'application/zip', 'Accept-Ranges': 'bytes', 'ETag': etag}
+            start, end = 0, len(data) - 1
+            code = 200
+            range_match = None if server.ignore_range else _RANGE_RE.match(self.headers.get('Range', ''))
+            if_range = self.headers.get('If-Range')
+            if range_match and (not if_range or if_range == etag):
+                first, last = range_match.groups()
+                if first: start, end = int(first), min(int(last), end) if last else end
+                else: start = max(0, len(data) - int(last))
+                if start > end:
+                    self._headers(416, 0, {'Content-Range': f"bytes */{len(data)}"})
+                    return
+                code = 206
+                headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+            self._headers(code, end - start + 1, headers)
+            if self.command == 'HEAD': return
+            body = data[start:end + 1]
+            with server.lock:
+                drop = server.drops > 0 and server.drop_after < len(body)
+                if drop: server.drops -= 1
+            if not drop: return self._write(body)
+            # Обрыв: Content-Length обещан полный, а соединение закрывается после части тела
+            self._write(body[:server.drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+
+    return Handler
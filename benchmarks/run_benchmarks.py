@@ -0,0 +1,378 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Бенчмарки обновлятора без сети и без Windows: GitHub заменяется локальной заглушкой, диск - синтетическим
+# деревом папок, psutil - поддельной таблицей процессов, winreg/winshell/ctypes.windll - заглушками из shims.
+# Запуск: python benchmarks/run_benchmarks.py [--dirs 100000] [--baseline benchmarks/baseline.json]
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+CASES = ('import_time', 'search_cold', 'search_indexed', 'kill_processes', 'download', 'download_resume', 'verify', 'extract', 'update_e2e',
+         'update_cached', 'cache_corrupt')
+# Тяжелые модули, которые должны загружаться при первом использовании, а не при импорте zapret_updater
+LAZY_MODULES = ('requests', 'github', 'psutil', 'tkinter', 'winshell', 'zipfile')
+OLD_VERSION = '1.8.0'
+NEW_VERSION = '1.8.1'
+BROKEN_VERSION = '1.8.9' # Релиз без опубликованной контрольной суммы с испорченным файлом в архиве
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарки поиска, скачивания, проверки, распаковки и обновления Zapret.")
+    parser.add_argument('--dirs', type=int, default=10000, help="Число папок в синтетическом дереве диска (10000 - 1000000)")
+    parser.add_argument('--size-mb', type=float, default=8, help="Размер архива релиза, MB")
+    parser.add_argument('--latency', type=float, default=0.02, help="Задержка ответа заглушки GitHub, сек")
+    parser.add_argument('--throughput', type=float, default=0, help="Скорость отдачи на одно соединение, MB/сек (0 - без ограничения)")
+    parser.add_argument('--processes', type=int, default=300, help="Число процессов в поддельной таблице")
+    parser.add_argument('--repeat', type=int, default=5, help="Повторов каждого замера (в отчет идет медиана)")
+    parser.add_argument('--cases', default=','.join(CASES), help="Замеры через запятую: " + ', '.join(CASES))
+    parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baseline.json'), help="Файл с базовыми результатами")
+    parser.add_argument('--update-baseline', action='store_true', help="Сохранить текущие результаты как базовые")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Допустимое замедление относительно базовых результатов (0.25 = 25%%)")
+    parser.add_argument('--import-budget', type=float, default=0.15, help="Предел времени импорта zapret_updater, сек (замер import_time)")
+    parser.add_argument('--workdir', help="Папка для синтетических данных (по умолчанию временная, удаляется после запуска)")
+    return parser.parse_args(argv)
+
+def prepare_environment(workdir):
+    # Все пути, которые обновлятор берет из окружения, указывают внутрь workdir. Дерево "диска" лежит вне TEMP:
+    # папки внутри TEMP сканер установкой не считает.
+    for var, subdir in (('LOCALAPPDATA', 'appdata'), ('USERPROFILE', 'user'), ('TEMP', 'temp'), ('TMP', 'temp'), ('BENCH_DESKTOP', 'desktop')):
+        path = os.path.join(workdir, subdir)
+        os.makedirs(path, exist_ok=True)
+        os.environ[var] = path
+    sys.path[:0] = [os.path.join(BENCH_DIR, 'shims'), REPO_DIR, BENCH_DIR]
+    import windll
+    windll.install()
+
+    import logger_setup
+    with contextlib.redirect_stdout(io.StringIO()): logger_setup.setup_logging()
+    # В консоль выводится только отчет бенчмарка, лог обновлятора - в файл внутри workdir
+    import logging
+    logger_setup._listener.handlers = tuple(h for h in logger_setup._listener.handlers if isinstance(h, logging.FileHandler))
+    return os.path.join(logger_setup.log_dir, 'zapret_updater.log')
+
+def measure(repeat, setup, run, check=None):
+    timings = []
+    for _ in range(repeat):
+        if setup: setup()
+        start = time.perf_counter()
+        result = run()
+        timings.append(time.perf_counter() - start)
+        if check and not check(result): raise RuntimeError(f"неверный результат: {result!r}")
+    return timings
+
+def measure_import_time(repeat):
+    # Холодный импорт zapret_updater в отдельном процессе под -X importtime. Время берется из строки
+    # zapret_updater (без запуска интерпретатора и site), список модулей - разница sys.modules до и после импорта
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(BENCH_DIR, 'shims'), REPO_DIR]))
+    code = "import sys; before = set(sys.modules); import zapret_updater; print('\\n'.join(set(sys.modules) - before))"
+    timings = []
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], env=env, cwd=REPO_DIR,
+                                   capture_output=True, text=True, check=True)
+        loaded = [name for name in completed.stdout.split() if name.split('.', 1)[0] in LAZY_MODULES]
+        if loaded: raise RuntimeError(f"при импорте zapret_updater загружены: {', '.join(sorted(loaded))}")
+        for line in completed.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == 'zapret_updater':
+                timings.append(int(fields[1]) / 1e6)
+                break
+        else:
+            raise RuntimeError("в выводе -X importtime нет строки zapret_updater")
+    return timings
+
+def join_background_deletes():
+    for thread in threading.enumerate():
+        if thread.name == 'zapret-remove-tombstone': thread.join()
+
+def run_cases(args, workdir, selected):
+    import artifact_cache
+    import config
+    import filesystem
+    import install_scanner
+    import location_index
+    import services
+    import system_ops
+    import zapret_ops
+    import zipfile
+    from fake_github import FakeGithubServer
+    import synthetic
+
+    results = {}
+    if 'import_time' in selected:
+        # Замер в отдельных процессах, синтетические данные ему не нужны
+        print("  import_time...", end='', flush=True)
+        timings = measure_import_time(args.repeat)
+        results['import_time'] = {'median': statistics.median(timings), 'min': min(timings)}
+        print(f" {results['import_time']['median']:.3f} сек")
+    if not any(name != 'import_time' for name in selected): return results
+
+    print(f"Подготовка данных в {workdir}...")
+    drive_root = os.path.join(workdir, 'drive')
+    install_dir, dir_count = synthetic.make_drive_tree(drive_root, args.dirs)
+    old_zip = synthetic.make_release_zip(OLD_VERSION, args.size_mb, seed=1)
+    new_zip = synthetic.make_release_zip(NEW_VERSION, args.size_mb, seed=2, changed_fraction=0.25, base_seed=1)
+    synthetic.install_release(old_zip, install_dir)
+    print(f"Дерево: {dir_count} папок, установка: {install_dir}; архив: {len(new_zip) / 1024 / 1024:.1f} MB")
+
+    server = FakeGithubServer(latency=args.latency, throughput=int(args.throughput * 1024 * 1024)).start()
+    server.add_release(config.REPO_NAME, f"v{OLD_VERSION}", {f"zapret-discord-youtube-{OLD_VERSION}.zip": old_zip})
+    server.add_release(config.REPO_NAME, f"v{NEW_VERSION}", {f"zapret-discord-youtube-{NEW_VERSION}.zip": new_zip})
+    config.GITHUB_API_URL = server.url
+    config.ARTIFACT_CACHE_MAX_BYTES = 0 # Каждое обновление качает архив заново
+    config.RELEASE_CACHE_TTL = 0        # и заново спрашивает релиз (условным запросом)
+    config.RETRY_DELAY = 0.1
+    asset_url = f"{server.url}/{config.REPO_NAME}/releases/download/v{NEW_VERSION}/zapret-discord-youtube-{NEW_VERSION}.zip"
+    asset_sha256 = server.releases[config.REPO_NAME][0]['assets'][0]['digest'].split(':', 1)[1]
+
+    service_backend = synthetic.FakeServiceBackend(config.SERVICES_TO_MANAGE)
+    services.set_backend(service_backend)
+    process_table = synthetic.FakeProcessTable(args.processes, install_dir).install()
+    index_path = os.path.join(workdir, 'location_index.json')
+    zip_path = os.path.join(workdir, 'download', 'release.zip')
+    extract_dir = os.path.join(workdir, 'extract', 'zapret')
+    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+
+    def remove_index():
+        if os.path.exists(index_path): os.remove(index_path)
+
+    def search():
+        return install_scanner.scan_for_installation([drive_root], location_index.LocationIndex(index_path))
+
+    def found_install(result):
+        return result.found_path and os.path.normcase(result.found_path) == os.path.normcase(install_dir)
+
+    def kill():
+        return system_ops.kill_processes_using_folder(install_dir, system_ops.ProcessSnapshot())
+
+    def remove_download():
+        if os.path.exists(zip_path): os.remove(zip_path)
+
+    # Файл меньше SEGMENTED_DOWNLOAD_MIN_SIZE - качается одним потоком с докачкой через Range/If-Range
+    resume_data = random.Random(4).randbytes(1024 * 1024)
+    resume_sha256 = hashlib.sha256(resume_data).hexdigest()
+    resume_url = server.add_asset('/bench/resume.bin', resume_data)
+    resume_etag = server.assets['/bench/resume.bin'][1]
+    resume_target = os.path.join(workdir, 'download', 'resume.bin')
+    resume_part = resume_target + config.DOWNLOAD_PART_SUFFIX
+
+    def write_partial(data, etag):
+        with open(resume_part, 'wb') as f: f.write(data)
+        with open(resume_part + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'url': resume_url, 'etag': etag, 'last_modified': None, 'total_size': len(resume_data)}, f)
+
+    def drop_twice():
+        server.drop_after, server.drops = 256 * 1024, 2
+
+    def ignore_range():
+        server.ignore_range = True
+
+    def download_resume():
+        # Сценарии: (название, подготовка, ожидаемые заголовки Range у GET). Возвращает список не пройденных
+        garbage = b'\0' * 300000
+        scenarios = (
+            ('обрывы соединения', drop_twice, [None, 'bytes=262144-', 'bytes=524288-']),
+            ('часть уже скачана целиком (416)', lambda: write_partial(resume_data, resume_etag), ['bytes=1048576-']),
+            ('сервер игнорирует Range (200)', lambda: (write_partial(garbage, resume_etag), ignore_range()), ['bytes=300000-']),
+            ('файл на сервере изменился (If-Range)', lambda: write_partial(garbage, '"stale"'), ['bytes=300000-']),
+        )
+        failures = []
+        for name, prepare, expected_ranges in scenarios:
+            filesystem._remove_partial_download(resume_part, resume_part + '.json')
+            if os.path.exists(resume_target): os.remove(resume_target)
+            prepare()
+            since = len(server.requests)
+            try:
+                ok = filesystem.download_file(resume_url, resume_target, "файла для докачки", resume_sha256)
+            finally:
+                server.drops, server.ignore_range = 0, False
+            ranges = [rng for command, path, rng in server.requests[since:] if command == 'GET' and path == '/bench/resume.bin']
+            if not ok or ranges != expected_ranges: failures.append(f"{name}: скачан={ok}, Range={ranges}")
+        return failures
+
+    def verify():
+        with zipfile.ZipFile(zip_path) as zf: zf.infolist()
+        return filesystem._hash_file(zip_path).hexdigest() == asset_sha256
+
+    def extract():
+        extracted = filesystem.extract_archive(zip_path, extract_dir)
+        return bool(extracted) and filesystem.move_extracted_files(extracted[0], extracted[1], extract_dir)
+
+    def reset_extract():
+        if os.path.exists(extract_dir): shutil.rmtree(extract_dir)
+
+    def reset_install():
+        join_background_deletes()
+        if os.path.exists(install_dir): shutil.rmtree(install_dir)
+        synthetic.install_release(old_zip, install_dir)
+        process_table.reset()
+        service_backend.reset()
+
+    def update():
+        return zapret_ops.perform_install_or_update(NEW_VERSION, install_dir, is_update=True)
+
+    def updated(result):
+        return result and zapret_ops.read_version_file(os.path.join(install_dir, 'version.txt')).get('ver') == NEW_VERSION
+
+    def asset_name(version):
+        return f"zapret-discord-youtube-{version}.zip"
+
+    def cache_entries():
+        return artifact_cache._load_index()['entries']
+
+    def cache_key(version):
+        return f"{config.REPO_NAME}/v{version}/{asset_name(version)}"
+
+    def reset_cache(max_bytes):
+        shutil.rmtree(artifact_cache._cache_dir(), ignore_errors=True)
+        config.ARTIFACT_CACHE_MAX_BYTES = max_bytes
+
+    def seed_cache(version, data):
+        seed_path = os.path.join(workdir, 'download', 'seed.zip')
+        with open(seed_path, 'wb') as f: f.write(data)
+        artifact_cache.store_artifact(config.REPO_NAME, f"v{version}", asset_name(version), seed_path)
+        os.remove(seed_path)
+
+    cached_run = {}
+
+    def reset_cached_update():
+        # Кеш вмещает только один архив: в нем лежит старый релиз, первое обновление скачивает новый
+        # и вытесняет старый, второе (замеряемое) берет новый из кеша без обращения к серверу
+        reset_install()
+        reset_cache(len(old_zip) + len(new_zip) - 1)
+        seed_cache(OLD_VERSION, old_zip)
+        if not update(): raise RuntimeError("первое обновление не удалось")
+        entries = cache_entries()
+        if cache_key(OLD_VERSION) in entries or cache_key(NEW_VERSION) not in entries:
+            raise RuntimeError(f"кеш после первого обновления: {sorted(entries)}")
+        join_background_deletes()
+        reset_install()
+        cached_run.update(hits=artifact_cache._load_index()['hits'], requests=len(server.requests))
+
+    def updated_from_cache(result):
+        downloads = [path for _, path, _ in server.requests[cached_run['requests']:] if '/releases/download/' in path]
+        return updated(result) and artifact_cache._load_index()['hits'] == cached_run['hits'] + 1 and not downloads
+
+    def reset_corrupt_cache():
+        # Архив с испорченными данными (центральный каталог цел) уже лежит в кеше, как после старых версий обновлятора
+        if not any(release['tag_name'] == f"v{BROKEN_VERSION}" for release in server.releases[config.REPO_NAME]):
+            broken = synthetic.make_release_zip(BROKEN_VERSION, args.size_mb, seed=3, changed_fraction=1.0, base_seed=1)
+            cached_run['broken_zip'] = synthetic.corrupt_zip(broken, 'bin/data/blob00.bin')
+            server.add_release(config.REPO_NAME, f"v{BROKEN_VERSION}", {asset_name(BROKEN_VERSION): cached_run['broken_zip']}, digest=False)
+        reset_install()
+        reset_cache(len(cached_run['broken_zip']) * 2)
+        seed_cache(BROKEN_VERSION, cached_run['broken_zip'])
+
+    def update_broken():
+        return zapret_ops.perform_install_or_update(BROKEN_VERSION, install_dir, is_update=True)
+
+    def corrupt_dropped(result):
+        version = zapret_ops.read_version_file(os.path.join(install_dir, 'version.txt')).get('ver')
+        return result is False and version == OLD_VERSION and cache_key(BROKEN_VERSION) not in cache_entries()
+
+    plan = {
+        'search_cold': (remove_index, search, found_install),
+        'search_indexed': (None, search, found_install),
+        'kill_processes': (process_table.reset, kill, lambda killed: killed == 2),
+        'download': (remove_download, lambda: filesystem.download_file(asset_url, zip_path, "архива бенчмарка", asset_sha256), bool),
+        'download_resume': (None, download_resume, lambda failures: not failures),
+        'verify': (None, verify, bool),
+        'extract': (reset_extract, extract, bool),
+        'update_e2e': (reset_install, update, updated),
+        'update_cached': (reset_cached_update, update, updated_from_cache),
+        'cache_corrupt': (reset_corrupt_cache, update_broken, corrupt_dropped),
+    }
+    try:
+        if 'search_indexed' in selected and 'search_cold' not in selected:
+            remove_index()
+            search() # Индекс строится один раз до замеров
+        if ('verify' in selected or 'extract' in selected) and 'download' not in selected:
+            with open(zip_path, 'wb') as f: f.write(new_zip)
+        for name in CASES:
+            if name not in selected or name == 'import_time': continue
+            setup, run, check = plan[name]
+            print(f"  {name}...", end='', flush=True)
+            with contextlib.redirect_stdout(io.StringIO()):
+                timings = measure(args.repeat, setup, run, check)
+            join_background_deletes()
+            results[name] = {'median': statistics.median(timings), 'min': min(timings)}
+            print(f" {results[name]['median']:.3f} сек")
+    finally:
+        process_table.uninstall()
+        server.stop()
+    return results
+
+def compare_with_baseline(results, params, baseline, tolerance):
+    # Сравнивается лучший из повторов: он меньше всего зависит от фоновой нагрузки. Регрессия - хуже базового
+    # больше чем на tolerance и при этом больше чем на 50 мс (короткие замеры иначе срабатывают от шума)
+    regressions = []
+    comparable = baseline.get('params') == params
+    if baseline and not comparable:
+        print("Внимание: параметры запуска отличаются от базовых, регрессии не проверяются.")
+    print(f"{'замер':<16}{'медиана':>10}{'мин':>10}{'база (мин)':>12}{'изменение':>12}")
+    for name, result in results.items():
+        base = baseline.get('results', {}).get(name)
+        line = f"{name:<16}{result['median']:>10.3f}{result['min']:>10.3f}"
+        if base:
+            change = result['min'] / base['min'] - 1 if base['min'] else 0.0
+            line += f"{base['min']:>12.3f}{change:>+11.0%}"
+            if comparable and result['min'] > base['min'] * (1 + tolerance) and result['min'] - base['min'] > 0.05:
+                regressions.append(name)
+                line += "  РЕГРЕССИЯ"
+        print(line)
+    return regressions
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = [name.strip() for name in args.cases.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in CASES]
+    if unknown:
+        print(f"Неизвестные замеры: {', '.join(unknown)}")
+        return 2
+    params = {'dirs': args.dirs, 'size_mb': args.size_mb, 'latency': args.latency, 'throughput': args.throughput,
+              'processes': args.processes, 'repeat': args.repeat}
+
+    workdir = os.path.abspath(args.workdir) if args.workdir else tempfile.mkdtemp(prefix='zapret-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    log_file = None
+    try:
+        log_file = prepare_environment(workdir)
+        results = run_cases(args, workdir, selected)
+    finally:
+        join_background_deletes()
+        import logger_setup
+        logger_setup.stop_logging()
+        if not args.workdir: shutil.rmtree(workdir, ignore_errors=True)
+        elif log_file: print(f"Лог обновлятора: {log_file}")
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f: baseline = json.load(f)
+    regressions = compare_with_baseline(results, params, baseline, args.tolerance)
+    if args.update_baseline:
+        merged = dict(baseline.get('results', {})) if baseline.get('params') == params else {}
+        merged.update(results)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'python': sys.version.split()[0], 'platform': sys.platform, 'results': merged}, f, indent=2)
+        print(f"Базовые результаты сохранены в {args.baseline}")
+        return 0
+    if 'import_time' in results and results['import_time']['min'] > args.import_budget:
+        print(f"Импорт zapret_updater занимает {results['import_time']['min']:.3f} сек, предел {args.import_budget:.3f} сек.")
+        return 1
+    if regressions:
+        print(f"Замедление больше {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,16 @@
+# Заглушка ctypes.windll: процесс считается запущенным от Администратора, диски не перечисляются
+class _Shell32:
+    def IsUserAnAdmin(self): return 1
+    def ShellExecuteW(self, *args): return 42
+
+class _Kernel32:
+    def GetLogicalDrives(self): return 0
+    def GetDriveTypeW(self, root): return 0
+
+class WinDLL:
+    shell32 = _Shell32()
+    kernel32 = _Kernel32()
+
+def install():
+    import ctypes
+    if not hasattr(ctypes, 'windll'): ctypes.windll = WinDLL()
@@ -0,0 +1,46 @@
+# Заглушка winreg для запуска бенчмарков вне Windows: реестр хранится в памяти процесса
+HKEY_CURRENT_USER = 'HKEY_CURRENT_USER'
+HKEY_LOCAL_MACHINE = 'HKEY_LOCAL_MACHINE'
+KEY_READ = 0x20019
+KEY_WRITE = 0x20006
+KEY_ALL_ACCESS = 0xF003F
+REG_SZ = 1
+REG_DWORD = 4
+
+_registry = {}
+
+class _Key:
+    def __init__(self, path):
+        self.path = path
+
+def _path(key, sub_key):
+    base = key.path if isinstance(key, _Key) else key
+    return f"{base}\\{sub_key}" if sub_key else base
+
+def CreateKey(key, sub_key):
+    path = _path(key, sub_key)
+    _registry.setdefault(path, {})
+    return _Key(path)
+
+def OpenKey(key, sub_key, reserved=0, access=KEY_READ):
+    path = _path(key, sub_key)
+    if path not in _registry: raise FileNotFoundError(2, "Не удается найти указанный файл", path)
+    return _Key(path)
+
+def CloseKey(key):
+    pass
+
+def SetValueEx(key, value_name, reserved, value_type, value):
+    _registry[key.path][value_name] = (value, value_type)
+
+def QueryValueEx(key, value_name):
+    try: return _registry[key.path][value_name]
+    except KeyError: raise FileNotFoundError(2, "Не удается найти указанный файл", value_name)
+
+def DeleteValue(key, value_name):
+    try: del _registry[key.path][value_name]
+    except KeyError: raise FileNotFoundError(2, "Не удается найти указанный файл", value_name)
+
+def DeleteKey(key, sub_key):
+    try: del _registry[_path(key, sub_key)]
+    except KeyError: raise FileNotFoundError(2, "Не удается найти указанный файл", sub_key)
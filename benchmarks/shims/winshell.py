@@ -0,0 +1,28 @@
+# Заглушка winshell для запуска бенчмарков вне Windows: ярлык пишется как текстовый файл
+import os
+import tempfile
+
+def desktop():
+    path = os.environ.get('BENCH_DESKTOP') or os.path.join(tempfile.gettempdir(), 'bench-desktop')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class _Shortcut:
+    def __init__(self, path):
+        self.lnk_filepath = path
+        self.path = ''
+        self.working_directory = ''
+        self.description = ''
+        self.run_as_admin = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            with open(self.lnk_filepath, 'w', encoding='utf-8') as f:
+                f.write(f"{self.path}\n{self.working_directory}\n")
+        return False
+
+def shortcut(path):
+    return _Shortcut(path)
@@ -0,0 +1,192 @@
+import io
+import os
+import random
+import threading
+import time
+import zipfile
+
+# Синтетические данные для бенчмарков: дерево папок "диска" с установкой Zapret, архивы релизов,
+# поддельная таблица процессов для psutil и поддельный менеджер служб
+
+def make_drive_tree(root, dir_count, depth=3, seed=1):
+    # Дерево примерно из dir_count папок глубиной depth (как SEARCH_DEPTH_LIMIT: глубже сканер не заходит).
+    # Установка кладется на максимальную глубину в последнюю ветку под ничем не примечательным именем,
+    # чтобы сканеру пришлось просмотреть почти все дерево. Возвращает (путь установки, число созданных папок).
+    fanout = 2
+    while sum(fanout ** level for level in range(1, depth + 1)) < dir_count: fanout += 1
+    rng = random.Random(seed)
+    created = 0
+    levels = [[root]]
+    os.makedirs(root, exist_ok=True)
+    for level in range(1, depth + 1):
+        next_dirs = []
+        for parent in levels[-1]:
+            for i in range(fanout):
+                if created >= dir_count: break
+                path = os.path.join(parent, f"d{level}_{i:04d}")
+                os.mkdir(path)
+                created += 1
+                next_dirs.append(path)
+                # Часть папок с файлами, похожими на установку, но без bin - сканер должен их читать и отбрасывать
+                if rng.random() < 0.02:
+                    with open(os.path.join(path, 'readme.txt'), 'w') as f: f.write('x')
+        levels.append(next_dirs)
+    install_dir = os.path.join(levels[depth - 1][-1], 'tools')
+    return install_dir, created
+
+def make_release_zip(version, size_mb, seed=1, changed_fraction=0.0, base_seed=None):
+    # Архив в формате релиза zapret-discord-youtube: файлы в корне архива, bin с ключевыми файлами,
+    # .bat, списки .txt и version.txt. Наполнитель - несжимаемые данные общим объемом около size_mb.
+    # changed_fraction - доля файлов наполнителя, отличающихся от архива с base_seed (для обновления по изменениям).
+    rng = random.Random(seed)
+    base_rng = random.Random(base_seed if base_seed is not None else seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('bin/winws.exe', base_rng.randbytes(128 * 1024))
+        zf.writestr('bin/WinDivert.dll', base_rng.randbytes(64 * 1024))
+        zf.writestr('bin/WinDivert64.sys', base_rng.randbytes(96 * 1024))
+        zf.writestr('bin/cygwin1.dll', base_rng.randbytes(256 * 1024))
+        zf.writestr('general.bat', '@echo off\r\nstart "zapret" /min "%~dp0bin\\winws.exe" --wf-tcp=80,443\r\n')
+        zf.writestr('service_install.bat', '@echo off\r\nsc create zapret binPath= "%~dp0bin\\winws.exe"\r\n')
+        zf.writestr('list-general.txt', '\n'.join(f"host{i}.example.com" for i in range(5000)))
+        zf.writestr('version.txt', f"ver: {version}\n")
+        filler_count = 32
+        filler_size = max(1, int(size_mb * 1024 * 1024) // filler_count)
+        for i in range(filler_count):
+            data = base_rng.randbytes(filler_size)
+            if rng.random() < changed_fraction: data = rng.randbytes(filler_size)
+            zf.writestr(f"bin/data/blob{i:02d}.bin", data, compress_type=zipfile.ZIP_STORED)
+    return buffer.getvalue()
+
+def corrupt_zip(zip_bytes, member):
+    # Портит данные файла в архиве, не трогая центральный каталог: архив открывается, а распаковка падает на CRC
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        info = zf.getinfo(member)
+    data = bytearray(zip_bytes)
+    name_length = int.from_bytes(data[info.header_offset + 26:info.header_offset + 28], 'little')
+    extra_length = int.from_bytes(data[info.header_offset + 28:info.header_offset + 30], 'little')
+    data_start = info.header_offset + 30 + name_length + extra_length
+    data[data_start + info.compress_size // 2] ^= 0xFF
+    return bytes(data)
+
+def install_release(zip_bytes, install_dir):
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        zf.extractall(install_dir)
+
+class FakeOpenFile:
+    __slots__ = ('path',)
+
+    def __init__(self, path):
+        self.path = path
+
+class FakeProcess:
+    # Минимальный аналог psutil.Process для ProcessSnapshot и terminate_processes
+    def __init__(self, table, pid, name, exe, cmdline, open_files):
+        self.table = table
+        self.pid = pid
+        self.info = {'pid': pid, 'name': name, 'exe': exe, 'cmdline': cmdline, 'create_time': 1000.0 + pid}
+        self._open_files = open_files
+        self.running = True
+
+    def as_dict(self, attrs=None, ad_value=None):
+        return {key: self.info[key] for key in (attrs or self.info)}
+
+    def open_files(self):
+        import psutil
+        if not self.running: raise psutil.NoSuchProcess(self.pid)
+        # Ожидание в цикле, а не sleep: сотни коротких sleep дают заметный разброс из-за планировщика
+        deadline = time.perf_counter() + self.table.open_files_cost
+        while time.perf_counter() < deadline: pass
+        with self.table.lock: self.table.open_files_calls += 1
+        return [FakeOpenFile(path) for path in self._open_files]
+
+    def terminate(self):
+        import psutil
+        if not self.running: raise psutil.NoSuchProcess(self.pid)
+        self.running = False
+
+    def kill(self):
+        self.terminate()
+
+    def is_running(self):
+        return self.running
+
+class FakeProcessTable:
+    # Подменяет psutil.process_iter и psutil.wait_procs. Процессы, запущенные из папки установки
+    # (winws.exe и редактор с открытым списком), завершаются по terminate(); остальные - фоновый шум.
+    # open_files_cost - сколько секунд занимает open_files() у одного процесса (на Windows это самый дорогой вызов).
+    def __init__(self, count, install_dir, open_files_cost=0.0003):
+        self.count = count
+        self.install_dir = install_dir
+        self.open_files_cost = open_files_cost
+        self.lock = threading.Lock()
+        self.open_files_calls = 0
+        self.processes = []
+        self._saved = None
+        self.reset()
+
+    def reset(self):
+        processes = []
+        for pid in range(100, 100 + self.count):
+            exe = f"/usr/lib/app{pid}/app{pid}"
+            processes.append(FakeProcess(self, pid, f"app{pid}", exe, [exe, '--background'], [f"/var/lib/app{pid}/state.db"]))
+        winws = os.path.join(self.install_dir, 'bin', 'winws.exe')
+        processes.append(FakeProcess(self, 50, 'winws.exe', winws, [winws, '--wf-tcp=80,443'], []))
+        processes.append(FakeProcess(self, 51, 'notepad.exe', '/usr/bin/notepad', ['/usr/bin/notepad'],
+                                     [os.path.join(self.install_dir, 'list-general.txt')]))
+        self.processes = processes
+        self.open_files_calls = 0
+
+    def process_iter(self, attrs=None, ad_value=None):
+        return iter([proc for proc in self.processes if proc.running])
+
+    def wait_procs(self, procs, timeout=None, callback=None):
+        gone = [proc for proc in procs if not proc.running]
+        alive = [proc for proc in procs if proc.running]
+        if alive and timeout: time.sleep(timeout)
+        return gone, alive
+
+    def install(self):
+        import psutil
+        self._saved = (psutil.process_iter, psutil.wait_procs)
+        psutil.process_iter, psutil.wait_procs = self.process_iter, self.wait_procs
+        return self
+
+    def uninstall(self):
+        import psutil
+        if self._saved: psutil.process_iter, psutil.wait_procs = self._saved
+        self._saved = None
+
+class FakeServiceBackend:
+    # Вместо sc.exe для services.stop_and_delete_services: службы zapret и WinDivert "установлены" и запущены
+    STATE_STOPPED = 1
+    STATE_RUNNING = 4
+
+    def __init__(self, names, command_cost=0.0):
+        self.names = list(names)
+        self.command_cost = command_cost
+        self.states = {}
+        self.calls = 0
+        self.reset()
+
+    def reset(self):
+        self.states = {name.lower(): self.STATE_RUNNING for name in self.names}
+        self.calls = 0
+
+    def _command(self):
+        self.calls += 1
+        if self.command_cost: time.sleep(self.command_cost)
+
+    def query_states(self):
+        self._command()
+        return dict(self.states)
+
+    def stop(self, name):
+        self._command()
+        if name.lower() not in self.states: return 1060
+        self.states[name.lower()] = self.STATE_STOPPED
+        return 0
+
+    def delete(self, name):
+        self._command()
+        return 0 if self.states.pop(name.lower(), None) is not None else 1060
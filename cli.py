@@ -0,0 +1,283 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+
+from logger_setup import log_message
+import logger_setup
+import config
+import filesystem
+import github_api
+import system_ops
+import tracing
+import zapret_ops
+
+# Режим командной строки без вопросов, диалогов и пауз - для запуска из планировщика заданий и скриптов
+# развертывания: zapret_updater.exe update --yes --json. Результат - код завершения и (с --json) одна строка JSON в stdout.
+# watch работает постоянно и выводит строку результата после каждой проверки.
+
+COMMANDS = ('check', 'update', 'repair', 'uninstall', 'watch')
+
+# Коды завершения
+EXIT_OK = 0
+EXIT_ERROR = 1              # Операция не удалась
+EXIT_USAGE = 2              # Неверные аргументы (код argparse)
+EXIT_NOT_FOUND = 3          # Установка не найдена
+EXIT_NETWORK = 4            # Не удалось получить информацию о релизе с GitHub
+EXIT_NOT_ADMIN = 5          # Команде нужны права Администратора
+EXIT_NOT_CONFIRMED = 6      # Действие удаляет файлы, а --yes не указан
+EXIT_UPDATE_AVAILABLE = 10  # check: доступна новая версия
+
+# Единственные аргументы интерактивного режима; с любыми другими разбор идет здесь, и опечатка в команде
+# завершается ошибкой (код 2), а не зависает в меню в ожидании ввода
+INTERACTIVE_ARGS = ('--elevated', '--profile')
+
+def is_headless(argv):
+    return any(arg not in INTERACTIVE_ARGS for arg in argv[1:])
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--install-dir', help="Папка установки Zapret (без нее - автоматический поиск)")
+    common.add_argument('--yes', '-y', action='store_true', help="Подтвердить действия, удаляющие файлы")
+    common.add_argument('--json', action='store_true', help="Вывести результат одной строкой JSON в stdout (лог - в stderr)")
+
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), description="Установщик/обновлятор Zapret без интерактивного меню.")
+    commands = parser.add_subparsers(dest='command', required=True, metavar='команда')
+    commands.add_parser('check', parents=[common], help="Проверить наличие обновления (код 10 - доступно)")
+    commands.add_parser('update', parents=[common], help="Обновить Zapret; с --install-dir установить, если его там нет")
+    commands.add_parser('repair', parents=[common], help="Переустановить последнюю версию (нужен --yes)")
+    commands.add_parser('uninstall', parents=[common], help="Удалить Zapret, его службы и ярлык (нужен --yes)")
+    watch = commands.add_parser('watch', parents=[common], help="Работать постоянно и периодически проверять новые версии")
+    watch.add_argument('--interval', type=float, default=config.WATCH_INTERVAL, help="Секунд между проверками")
+    watch.add_argument('--jitter', type=float, default=config.WATCH_JITTER, help="Случайный разброс интервала, доля от 0 до 1")
+    watch.add_argument('--policy', choices=('notify', 'update'), default=config.WATCH_POLICY,
+                       help="notify - только сообщить о новой версии, update - обновить")
+    watch.add_argument('--checks', type=int, default=0, help="Выйти после этого числа проверок (0 - работать до остановки)")
+    return parser
+
+def _new_result(command):
+    return {'command': command, 'status': None, 'exit_code': None, 'install_dir': None,
+            'current_version': None, 'latest_version': None, 'update_available': None,
+            'updater_version': config.UPDATER_VERSION, 'message': None}
+
+def _emit(args, result):
+    # args.output - настоящий stdout (в режиме --json sys.stdout на время работы перенаправлен в stderr)
+    logger_setup.flush_logs()
+    print(json.dumps(result, ensure_ascii=False) if args.json else result['message'], file=args.output, flush=True)
+
+def _finish(result, exit_code, status, message, level='info'):
+    log_message(message, level)
+    result['exit_code'] = exit_code
+    result['status'] = status
+    result['message'] = message
+    return exit_code
+
+def _find_install(args, result):
+    # Возвращает папку валидной установки или None
+    if args.install_dir:
+        install_dir = os.path.abspath(args.install_dir)
+        found = install_dir if zapret_ops.is_valid_installation(install_dir) else None
+    else:
+        found = zapret_ops.find_installation()
+    if found:
+        result['install_dir'] = found
+        result['current_version'] = zapret_ops.get_current_version(found)
+    return found
+
+def _fetch_latest(result):
+    release = github_api.get_latest_github_release(config.REPO_NAME)
+    result['latest_version'] = release.tag_name.lstrip('v') if release else None
+    return result['latest_version']
+
+def _require_admin(result):
+    if system_ops.is_admin(): return True
+    _finish(result, EXIT_NOT_ADMIN, 'not_admin', "Для этой команды нужны права Администратора.", 'error')
+    return False
+
+def _require_yes(args, result, action):
+    if args.yes: return True
+    _finish(result, EXIT_NOT_CONFIRMED, 'not_confirmed', f"{action} удаляет файлы установки. Добавьте --yes для подтверждения.", 'error')
+    return False
+
+def command_check(args, result):
+    if not _find_install(args, result):
+        return _finish(result, EXIT_NOT_FOUND, 'not_found', "Установка Zapret не найдена.", 'warning')
+    if not _fetch_latest(result):
+        return _finish(result, EXIT_NETWORK, 'network_error', "Не удалось получить последнюю версию Zapret с GitHub.", 'error')
+    update_needed, reason = zapret_ops.check_update_needed(result['current_version'], result['latest_version'])
+    result['update_available'] = update_needed
+    if update_needed:
+        return _finish(result, EXIT_UPDATE_AVAILABLE, 'update_available', f"Доступно обновление Zapret: {reason}.")
+    return _finish(result, EXIT_OK, 'up_to_date', f"Обновление Zapret не требуется: {reason}.")
+
+def _install_new(args, result, latest_version):
+    install_dir = os.path.abspath(args.install_dir)
+    if os.path.isdir(install_dir) and os.listdir(install_dir) and not args.yes:
+        return _finish(result, EXIT_NOT_CONFIRMED, 'not_confirmed',
+                       f"Папка '{install_dir}' не пуста и не содержит установку Zapret. Добавьте --yes, чтобы заменить ее содержимое.", 'error')
+    try:
+        os.makedirs(install_dir, exist_ok=True)
+    except OSError as e:
+        return _finish(result, EXIT_ERROR, 'error', f"Не удалось создать папку {install_dir}: {e}", 'error')
+    if not filesystem.check_write_permission(install_dir):
+        return _finish(result, EXIT_ERROR, 'error', f"Нет прав на запись в папку {install_dir}.", 'error')
+    result['install_dir'] = install_dir
+    if not zapret_ops.perform_install_or_update(latest_version, install_dir, is_update=False):
+        return _finish(result, EXIT_ERROR, 'error', "Установка Zapret не удалась.", 'error')
+    result['current_version'] = latest_version
+    return _finish(result, EXIT_OK, 'installed', f"Zapret {latest_version} установлен в {install_dir}.")
+
+def command_update(args, result):
+    if not _require_admin(result): return result['exit_code']
+    if not _fetch_latest(result):
+        return _finish(result, EXIT_NETWORK, 'network_error', "Не удалось получить последнюю версию Zapret с GitHub.", 'error')
+    install_dir = _find_install(args, result)
+    if not install_dir:
+        if args.install_dir: return _install_new(args, result, result['latest_version'])
+        return _finish(result, EXIT_NOT_FOUND, 'not_found', "Установка Zapret не найдена. Укажите --install-dir, чтобы установить.", 'warning')
+    update_needed, reason = zapret_ops.check_update_needed(result['current_version'], result['latest_version'])
+    result['update_available'] = update_needed
+    if not update_needed:
+        return _finish(result, EXIT_OK, 'up_to_date', f"Обновление Zapret не требуется: {reason}.")
+    log_message(f"Обновляю Zapret: {reason}.")
+    if not zapret_ops.perform_install_or_update(result['latest_version'], install_dir, is_update=True):
+        return _finish(result, EXIT_ERROR, 'error', "Обновление Zapret не удалось.", 'error')
+    result['current_version'] = result['latest_version']
+    return _finish(result, EXIT_OK, 'updated', f"Zapret обновлен до версии {result['latest_version']}.")
+
+def command_repair(args, result):
+    if not _require_admin(result) or not _require_yes(args, result, "Переустановка"): return result['exit_code']
+    if not _fetch_latest(result):
+        return _finish(result, EXIT_NETWORK, 'network_error', "Не удалось получить последнюю версию Zapret с GitHub.", 'error')
+    install_dir = _find_install(args, result)
+    if not install_dir and args.install_dir and os.path.isdir(os.path.join(args.install_dir, 'bin')):
+        # Поврежденную установку (есть bin, но не хватает файлов) переустанавливаем в ту же папку
+        install_dir = result['install_dir'] = os.path.abspath(args.install_dir)
+    if not install_dir:
+        return _finish(result, EXIT_NOT_FOUND, 'not_found', "Установка Zapret не найдена.", 'warning')
+    if not zapret_ops.perform_install_or_update(result['latest_version'], install_dir, is_update=True):
+        return _finish(result, EXIT_ERROR, 'error', "Переустановка Zapret не удалась.", 'error')
+    result['current_version'] = result['latest_version']
+    return _finish(result, EXIT_OK, 'repaired', f"Zapret {result['latest_version']} переустановлен в {install_dir}.")
+
+def command_uninstall(args, result):
+    if not _require_admin(result) or not _require_yes(args, result, "Удаление"): return result['exit_code']
+    # Удаляем только папку, в которой действительно установлен Zapret - не произвольную папку из --install-dir
+    install_dir = _find_install(args, result)
+    if not install_dir:
+        return _finish(result, EXIT_NOT_FOUND, 'not_found', "Установка Zapret не найдена.", 'warning')
+    if not zapret_ops.perform_uninstall(install_dir):
+        return _finish(result, EXIT_ERROR, 'error', "Удаление Zapret не удалось.", 'error')
+    result['current_version'] = None
+    return _finish(result, EXIT_OK, 'uninstalled', f"Zapret удален из {install_dir}.")
+
+class _WatchState:
+    # Что режим watch держит в памяти между проверками, чтобы каждая проверка стоила одного условного
+    # запроса к GitHub (ответ 304, если релиз не менялся), а не полного запуска с поиском установки
+    def __init__(self):
+        self.install_dir = None
+        self.current_version = None
+        self.latest_version = None
+        self.version_mtime = None
+        self.notified_version = None
+
+def _version_mtime(install_dir):
+    try:
+        return os.stat(os.path.join(install_dir, 'version.txt')).st_mtime_ns
+    except OSError:
+        return None
+
+def _watch_check(args, state, result):
+    if not state.install_dir or not os.path.isdir(state.install_dir):
+        # Первая проверка или установку удалили/перенесли - ищем заново
+        state.install_dir = _find_install(args, result)
+        state.current_version = result['current_version']
+        state.version_mtime = _version_mtime(state.install_dir) if state.install_dir else None
+        if not state.install_dir:
+            return _finish(result, EXIT_NOT_FOUND, 'not_found', "Установка Zapret не найдена.", 'warning')
+    elif _version_mtime(state.install_dir) != state.version_mtime:
+        # version.txt изменился (например, обновили вручную) - перечитываем версию
+        state.current_version = zapret_ops.get_current_version(state.install_dir)
+        state.version_mtime = _version_mtime(state.install_dir)
+    result['install_dir'] = state.install_dir
+    result['current_version'] = state.current_version
+
+    if not _fetch_latest(result):
+        return _finish(result, EXIT_NETWORK, 'network_error', "Не удалось получить последнюю версию Zapret с GitHub.", 'error')
+    state.latest_version = result['latest_version']
+    update_needed, reason = zapret_ops.check_update_needed(state.current_version, result['latest_version'])
+    result['update_available'] = update_needed
+    if not update_needed:
+        return _finish(result, EXIT_OK, 'up_to_date', f"Обновление Zapret не требуется: {reason}.", 'debug')
+
+    if args.policy == 'notify':
+        # Об одной и той же версии предупреждаем в логе один раз, дальше только отмечаем в результате
+        level = 'warning' if state.notified_version != result['latest_version'] else 'debug'
+        state.notified_version = result['latest_version']
+        return _finish(result, EXIT_UPDATE_AVAILABLE, 'update_available', f"Доступно обновление Zapret: {reason}.", level)
+    log_message(f"Обновляю Zapret: {reason}.")
+    if not zapret_ops.perform_install_or_update(result['latest_version'], state.install_dir, is_update=True):
+        return _finish(result, EXIT_ERROR, 'error', "Обновление Zapret не удалось, повторю при следующей проверке.", 'error')
+    state.current_version = result['current_version'] = result['latest_version']
+    state.version_mtime = _version_mtime(state.install_dir)
+    return _finish(result, EXIT_OK, 'updated', f"Zapret обновлен до версии {result['latest_version']}.")
+
+def command_watch(args, result):
+    if args.policy == 'update' and not _require_admin(result): return result['exit_code']
+    state = _WatchState()
+    # Первая проверка тоже со случайной задержкой: компьютеры, включенные одновременно, не обращаются к GitHub разом
+    delay = random.uniform(0, args.interval * args.jitter)
+    log_message(f"Режим наблюдения: проверка каждые {args.interval:.0f} сек (±{args.jitter:.0%}), политика: {args.policy}. "
+                f"Первая проверка через {delay:.0f} сек.", 'info')
+    checks = 0
+    try:
+        while True:
+            time.sleep(delay)
+            check_result = _new_result(args.command)
+            with tracing.span('watch_check'):
+                try:
+                    filesystem.collect_tombstones()
+                    _watch_check(args, state, check_result)
+                except Exception as e:
+                    _finish(check_result, EXIT_ERROR, 'error', f"Непредвиденная ошибка при проверке: {e}", 'critical')
+                    if logger_setup.logger: logger_setup.logger.exception(e)
+            # Трассировка каждой проверки пишется сразу: процесс могут завершить без finally
+            # (остановка задачи планировщика), а накопленные за недели этапы не держим в памяти
+            if logger_setup.log_dir: tracing.write_trace(logger_setup.log_dir, 'zapret_updater_watch_trace.json', clear=True)
+            _emit(args, check_result)
+            checks += 1
+            if args.checks and checks >= args.checks: break
+            delay = args.interval * random.uniform(1 - args.jitter, 1 + args.jitter)
+            log_message(f"Следующая проверка через {delay:.0f} сек.", 'debug')
+    except KeyboardInterrupt:
+        pass
+    result.update(install_dir=state.install_dir, current_version=state.current_version, latest_version=state.latest_version)
+    return _finish(result, EXIT_OK, 'stopped', f"Наблюдение остановлено, выполнено проверок: {checks}.")
+
+_COMMAND_HANDLERS = {'check': command_check, 'update': command_update, 'repair': command_repair,
+                     'uninstall': command_uninstall, 'watch': command_watch}
+
+def run(argv):
+    # Возвращает код завершения. Все, что программа печатает в процессе, в режиме --json уходит в stderr,
+    # чтобы в stdout была только строка результата
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == 'watch' and (args.interval <= 0 or not 0 <= args.jitter < 1 or args.checks < 0):
+        parser.error("--interval должен быть больше 0, --jitter - от 0 до 1, --checks - не меньше 0")
+    args.output = sys.stdout
+    result = _new_result(args.command)
+    log_message(f"Режим командной строки: {args.command}", 'info')
+    with contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext():
+        result['exit_code'] = EXIT_ERROR
+        try:
+            filesystem.collect_tombstones() # Запуски по расписанию оставляют больше всего недоудаленных папок
+            result['exit_code'] = _COMMAND_HANDLERS[args.command](args, result)
+        except Exception as e:
+            _finish(result, EXIT_ERROR, 'error', f"Непредвиденная ошибка: {e}", 'critical')
+            if logger_setup.logger: logger_setup.logger.exception(e)
+
+    _emit(args, result)
+    return result['exit_code']
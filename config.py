@@ -8,20 +8,73 @@ REPO_NAME = "Flowseal/zapret-discord-youtube"
 
 TEMP_SUBDIR_DOWNLOAD = 'zapret-temp-dl'
 TEMP_SUBDIR_EXTRACT = 'zapret-temp-extract'
+TEMP_SUBDIR_DELTA = 'zapret-temp-delta'
+DOWNLOAD_PART_SUFFIX = '.part'
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_SEGMENTS = 4 # Число параллельных соединений при скачивании по частям (1 - отключить)
+SEGMENTED_DOWNLOAD_MIN_SIZE = 4 * 1024 * 1024 # Файлы меньше качаются одним потоком
 
 MAX_RETRIES = 3
 RETRY_DELAY = 5
 
+APP_DATA_DIR_NAME = 'ZapretUpdater'
+CACHE_SUBDIR = 'Cache'
+
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_TOKEN = None # Токен GitHub (повышает лимит запросов к API); можно задать в переменной окружения
+GITHUB_TOKEN_ENV_VARS = ('ZAPRET_UPDATER_GITHUB_TOKEN', 'GITHUB_TOKEN')
+RATE_LIMIT_STATE_FILE = 'rate_limit.json'
+RATE_LIMIT_RESERVE = 2 # Столько запросов оставляем в запасе, дальше используем кеш или ждем сброса лимита
+RATE_LIMIT_MAX_WAIT = 120 # сек. Если до сброса лимита дольше, а кеша нет - не ждем
+RATE_LIMIT_SECONDARY_WAIT = 60 # сек ожидания при вторичном лимите без заголовка Retry-After
+HTTP_POOL_CONNECTIONS = 4 # Число хостов, для которых держатся открытые соединения
+HTTP_POOL_MAXSIZE = 8 # Соединений на хост (не меньше DOWNLOAD_SEGMENTS)
+RELEASE_CACHE_FILE = 'releases.json'
+RELEASE_CACHE_TTL = 600 # сек. В пределах TTL метаданные релиза берутся из кеша без запроса к API
+ARTIFACT_CACHE_SUBDIR = 'Artifacts'
+ARTIFACT_CACHE_MAX_BYTES = 200 * 1024 * 1024 # 0 - не кешировать скачанные архивы
+
+WATCH_INTERVAL = 6 * 3600 # сек между проверками в режиме watch
+WATCH_JITTER = 0.2 # Случайный разброс интервала (доля), чтобы компьютеры не обращались к GitHub одновременно
+WATCH_POLICY = 'notify' # 'notify' - только сообщить о новой версии, 'update' - сразу обновить
+
+PROFILE_TOP_N = 30 # Строк в отчете профилирования (--profile)
+PROFILE_TRACEMALLOC_FRAMES = 10 # Глубина стека для мест выделения памяти
+
 SHORTCUT_TARGET_BAT = "general.bat"
 SHORTCUT_NAME = "Zapret General (Запуск от Админа).lnk"
 
+# 'staged' - новая версия собирается рядом и подменяет старую переименованием папок (минимальный простой),
+# 'delta' - изменившиеся файлы заменяются прямо в папке установки (меньше места на диске)
+UPDATE_STRATEGY = 'staged'
+STAGED_DIR_SUFFIX = '.zapret-new'
+BACKUP_DIR_SUFFIX = '.zapret-old'
+TOMBSTONE_SUFFIX = '.zapret-trash' # Папки, переименованные перед удалением в фоне
+TOMBSTONES_FILE = 'tombstones.json'
+REMOVE_WORKERS = 4 # Потоков для фонового удаления папок
+
 REGISTRY_KEY_PATH = r"Software\ZapretUpdater"
 REGISTRY_VALUE_PATH = "InstallPath"
 REGISTRY_VALUE_VERSION = "InstalledVersion" 
 
 SERVICES_TO_MANAGE = ["zapret", "WinDivert", "WinDivert14"]
+SERVICE_DEPENDENTS = {'WinDivert': ['zapret'], 'WinDivert14': ['zapret']} # Служба останавливается после перечисленных
+SERVICE_STOP_TIMEOUT = 15 # сек ожидания остановки служб
+SERVICE_DELETE_TIMEOUT = 3 # сек ожидания, пока удаленные службы пропадут из списка
+SERVICE_POLL_INTERVAL = 0.2
+
+PROCESS_TERMINATE_TIMEOUT = 3 # сек на корректное завершение процессов, после чего оставшиеся завершаются принудительно
+PROCESS_KILL_TIMEOUT = 2 # сек ожидания после принудительного завершения
 
 SEARCH_DEPTH_LIMIT = 3
+SEARCH_DRIVE_TYPES = ('fixed',) # Типы дисков для поиска: fixed, removable, network, optical, ramdisk
+DRIVE_PROBE_TIMEOUT = 3 # сек на проверку доступности диска
+SEARCH_WORKERS = 8 # Потоков для параллельного сканирования дисков
+LOCATION_INDEX_FILE = 'location_index.json'
+SEARCH_TIME_BUDGET = 60 # сек на весь поиск по дискам
+SEARCH_DRIVE_TIME_BUDGET = 30 # сек на один диск
+SEARCH_LIKELY_DIRS = ['Desktop', 'Downloads', 'Documents'] # Относительно папки пользователя, проверяются первыми
+SEARCH_MAX_CANDIDATES = 5
 BIN_ESSENTIAL_FILES = {'winws.exe', 'windivert.dll', 'windivert64.sys'} 
 
 EXCLUDED_DIRS_SEARCH = {
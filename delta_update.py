@@ -0,0 +1,193 @@
+import os
+import shutil
+import zlib
+
+from logger_setup import log_message
+import config
+
+def _normalize(relative_path):
+    # Пути в Windows регистронезависимы
+    return relative_path.replace('\\', '/').strip('/').lower()
+
+def _safe_relative_path(relative_path):
+    # Путь из архива в виде для ОС; None, если он абсолютный или выходит за корень установки (..\, C:\ и т.п.)
+    native = relative_path.replace('\\', '/').rstrip('/').replace('/', os.sep)
+    if not native or os.path.isabs(native) or os.path.splitdrive(native)[0]: return None
+    native = os.path.normpath(native)
+    if native == os.curdir or native == os.pardir or native.startswith(os.pardir + os.sep): return None
+    return native
+
+def _path_inside(base_dir, relative_path):
+    # Полный путь внутри base_dir; проверяется еще раз при записи и удалении, а не только при построении плана
+    base_dir = os.path.abspath(base_dir)
+    target_path = os.path.abspath(os.path.join(base_dir, relative_path))
+    if os.path.commonpath([base_dir, target_path]) != base_dir or target_path == base_dir:
+        raise OSError(f"путь {relative_path} выходит за пределы {base_dir}")
+    return target_path
+
+def _file_crc32(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(config.DOWNLOAD_CHUNK_SIZE)
+            if not chunk: break
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+def build_install_manifest(install_dir):
+    # {нормализованный путь: (относительный путь, размер)}; CRC32 считается позже и только при совпадении размера
+    files, dirs = {}, {}
+    for root, dir_names, file_names in os.walk(install_dir):
+        for name in dir_names:
+            relative_path = os.path.relpath(os.path.join(root, name), install_dir)
+            dirs[_normalize(relative_path)] = relative_path
+        for name in file_names:
+            full_path = os.path.join(root, name)
+            relative_path = os.path.relpath(full_path, install_dir)
+            files[_normalize(relative_path)] = (relative_path, os.path.getsize(full_path))
+    return files, dirs
+
+def _get_archive_root(zip_ref):
+    # Та же логика, что в filesystem.extract_archive: единственная папка '*zapret*' в корне архива считается корнем
+    top_dirs = {info.filename.split('/', 1)[0] for info in zip_ref.infolist() if '/' in info.filename.strip('/') or info.is_dir()}
+    if len(top_dirs) == 1:
+        top_dir = next(iter(top_dirs))
+        if 'zapret' in top_dir.lower(): return top_dir + '/'
+    return ''
+
+def plan_delta_update(zip_path, install_dir):
+    # Возвращает план, None - план построить не удалось (можно полную переустановку),
+    # False - в архиве есть пути за пределами папки установки, обновление нужно отменить
+    import zipfile
+    try:
+        with zipfile.ZipFile(zip_path) as zip_ref:
+            archive_root = _get_archive_root(zip_ref)
+            entries = {}
+            paths = {}
+            dirs = []
+            new_dirs = set()
+            for info in zip_ref.infolist():
+                if not info.filename.startswith(archive_root) or info.filename == archive_root: continue
+                relative_path = _safe_relative_path(info.filename[len(archive_root):])
+                if relative_path is None:
+                    log_message(f"Архив содержит недопустимый путь '{info.filename}'. Обновление отменено.", 'error')
+                    return False
+                if info.is_dir():
+                    new_dirs.add(_normalize(relative_path))
+                    dirs.append(relative_path)
+                else:
+                    entries[_normalize(relative_path)] = info
+                    paths[info.filename] = relative_path
+                    parent = os.path.dirname(relative_path)
+                    while parent:
+                        new_dirs.add(_normalize(parent))
+                        parent = os.path.dirname(parent)
+        installed_files, installed_dirs = build_install_manifest(install_dir)
+    except (OSError, zipfile.BadZipFile) as e:
+        log_message(f"Не удалось построить план обновления по изменениям: {e}", 'warning')
+        return None
+
+    # paths - проверенные относительные пути файлов архива, dirs - папок; по ним пишут все шаги обновления
+    plan = {'changed': [], 'added': [], 'deleted': [], 'deleted_dirs': [], 'unchanged': [], 'archive_root': archive_root,
+            'paths': paths, 'dirs': dirs}
+    for key, info in entries.items():
+        installed = installed_files.get(key)
+        if not installed:
+            plan['added'].append(info.filename)
+            continue
+        relative_path, size = installed
+        try:
+            if size == info.file_size and _file_crc32(os.path.join(install_dir, relative_path)) == info.CRC:
+                plan['unchanged'].append((info.filename, relative_path))
+                continue
+        except OSError as e:
+            log_message(f"Не удалось прочитать {relative_path}: {e}. Файл будет заменен.", 'debug')
+        plan['changed'].append(info.filename)
+    plan['deleted'] = [relative_path for key, (relative_path, _) in installed_files.items() if key not in entries]
+    # Сначала самые вложенные папки, чтобы удалять их уже пустыми
+    plan['deleted_dirs'] = sorted((relative_path for key, relative_path in installed_dirs.items() if key not in new_dirs),
+                                  key=lambda p: p.count(os.sep), reverse=True)
+    log_message(f"План обновления: новых файлов {len(plan['added'])}, измененных {len(plan['changed'])}, "
+                f"удаляемых {len(plan['deleted'])}, без изменений {len(plan['unchanged'])}.")
+    return plan
+
+def stage_delta_files(zip_path, plan, staging_dir):
+    # Распаковываем только нужные файлы во временную папку; CRC проверяется при чтении из архива,
+    # так что поврежденный архив обнаружится до того, как будет тронута текущая установка
+    import zipfile
+    try:
+        if os.path.exists(staging_dir): shutil.rmtree(staging_dir)
+        os.makedirs(staging_dir)
+        plan['staged'] = {}
+        with zipfile.ZipFile(zip_path) as zip_ref:
+            for name in plan['added'] + plan['changed']:
+                plan['staged'][name] = zip_ref.extract(name, staging_dir)
+        return True
+    except (OSError, zipfile.BadZipFile) as e:
+        log_message(f"Ошибка подготовки файлов для обновления: {e}", 'error')
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return False
+
+def apply_delta_update(plan, staging_dir, install_dir):
+    stats = {'added': 0, 'replaced': 0, 'deleted': 0, 'bytes_written': 0}
+    try:
+        for kind, names in (('added', plan['added']), ('replaced', plan['changed'])):
+            for name in names:
+                source_path = plan['staged'][name]
+                target_path = _path_inside(install_dir, plan['paths'][name])
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                stats['bytes_written'] += os.path.getsize(source_path)
+                os.replace(source_path, target_path)
+                stats[kind] += 1
+        for relative_path in plan['deleted']:
+            os.remove(_path_inside(install_dir, relative_path))
+            stats['deleted'] += 1
+        for relative_path in plan['deleted_dirs']:
+            target_path = _path_inside(install_dir, relative_path)
+            try: os.rmdir(target_path)
+            except OSError: pass
+    except OSError as e:
+        log_message(f"Ошибка применения обновления по изменениям: {e}", 'error')
+        return None
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    log_message(f"Обновление по изменениям: добавлено {stats['added']}, заменено {stats['replaced']}, "
+                f"удалено {stats['deleted']} файлов, записано {stats['bytes_written'] / 1024:.1f} KB "
+                f"(без изменений: {len(plan['unchanged'])}).")
+    return stats
+
+def build_staged_tree(zip_path, plan, install_dir, staged_dir):
+    # Собирает новую версию целиком в отдельной папке: неизмененные файлы берутся из текущей установки
+    # (жесткой ссылкой, если ФС позволяет, иначе копией), новые и измененные - из архива
+    import zipfile
+    stats = {'linked': 0, 'copied': 0, 'extracted': 0}
+    try:
+        if os.path.exists(staged_dir): shutil.rmtree(staged_dir)
+        os.makedirs(staged_dir)
+        for name, relative_path in plan['unchanged']:
+            target_path = _path_inside(staged_dir, plan['paths'][name])
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            try:
+                os.link(os.path.join(install_dir, relative_path), target_path)
+                stats['linked'] += 1
+            except OSError:
+                shutil.copy2(os.path.join(install_dir, relative_path), target_path)
+                stats['copied'] += 1
+        with zipfile.ZipFile(zip_path) as zip_ref:
+            for name in plan['added'] + plan['changed']:
+                target_path = _path_inside(staged_dir, plan['paths'][name])
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                with zip_ref.open(name) as source, open(target_path, 'wb') as target:
+                    shutil.copyfileobj(source, target, config.DOWNLOAD_CHUNK_SIZE)
+                stats['extracted'] += 1
+        for relative_path in plan['dirs']:
+            os.makedirs(_path_inside(staged_dir, relative_path), exist_ok=True)
+    except (OSError, zipfile.BadZipFile) as e:
+        log_message(f"Ошибка подготовки новой версии в {staged_dir}: {e}", 'error')
+        shutil.rmtree(staged_dir, ignore_errors=True)
+        return False
+
+    log_message(f"Новая версия подготовлена в {staged_dir}: распаковано {stats['extracted']}, "
+                f"взято из текущей установки {stats['linked'] + stats['copied']} файлов (жестких ссылок: {stats['linked']}).")
+    return True
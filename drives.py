@@ -0,0 +1,118 @@
+import ctypes
+import os
+import string
+import threading
+import time
+
+from logger_setup import log_message
+import config
+
+DRIVE_FIXED = 'fixed'
+DRIVE_REMOVABLE = 'removable'
+DRIVE_NETWORK = 'network'
+DRIVE_OPTICAL = 'optical'
+DRIVE_RAMDISK = 'ramdisk'
+DRIVE_UNKNOWN = 'unknown'
+
+class WindowsDriveBackend:
+    # GetDriveTypeW: 2 - съемный, 3 - локальный, 4 - сетевой, 5 - CD/DVD, 6 - RAM-диск
+    _TYPES = {2: DRIVE_REMOVABLE, 3: DRIVE_FIXED, 4: DRIVE_NETWORK, 5: DRIVE_OPTICAL, 6: DRIVE_RAMDISK}
+
+    def list_roots(self):
+        mask = ctypes.windll.kernel32.GetLogicalDrives()
+        return [f"{letter}:\\" for i, letter in enumerate(string.ascii_uppercase) if mask & (1 << i)]
+
+    def drive_type(self, root):
+        return self._TYPES.get(ctypes.windll.kernel32.GetDriveTypeW(root), DRIVE_UNKNOWN)
+
+    def probe(self, root):
+        return os.path.isdir(root)
+
+class MountTableBackend:
+    # Читает таблицу монтирования в формате /proc/mounts. Нужен для работы и проверки логики вне Windows
+    # (можно подставить файл с вымышленными точками монтирования).
+    _NETWORK_FS = {'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'sshfs', 'fuse.sshfs', '9p'}
+    _OPTICAL_FS = {'iso9660', 'udf'}
+    _RAM_FS = {'tmpfs', 'ramfs'}
+    _PSEUDO_FS = {'proc', 'sysfs', 'devtmpfs', 'devpts', 'cgroup', 'cgroup2', 'securityfs', 'debugfs',
+                  'tracefs', 'mqueue', 'hugetlbfs', 'pstore', 'bpf', 'configfs', 'fusectl', 'autofs', 'overlay'}
+    _REMOVABLE_PREFIXES = ('/media/', '/run/media/', '/mnt/usb')
+
+    def __init__(self, mounts_file='/proc/self/mounts'):
+        self.mounts_file = mounts_file
+        self._fs_types = None
+
+    def _read_mounts(self):
+        if self._fs_types is None:
+            self._fs_types = {}
+            with open(self.mounts_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 3:
+                        mount_point = parts[1].replace('\\040', ' ')
+                        self._fs_types[mount_point] = parts[2]
+        return self._fs_types
+
+    def list_roots(self):
+        return [mount_point for mount_point, fs_type in self._read_mounts().items() if fs_type not in self._PSEUDO_FS]
+
+    def drive_type(self, root):
+        fs_type = self._read_mounts().get(root, '')
+        if fs_type in self._NETWORK_FS: return DRIVE_NETWORK
+        if fs_type in self._OPTICAL_FS: return DRIVE_OPTICAL
+        if fs_type in self._RAM_FS: return DRIVE_RAMDISK
+        if root.startswith(self._REMOVABLE_PREFIXES): return DRIVE_REMOVABLE
+        return DRIVE_FIXED
+
+    def probe(self, root):
+        return os.path.isdir(root)
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = WindowsDriveBackend() if os.name == 'nt' else MountTableBackend()
+    return _backend
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+def classify_drives(backend=None, timeout=None):
+    # Определяет тип и доступность каждого диска параллельно. Обращение к отключенному сетевому диску или
+    # спящему USB может зависнуть на секунды, поэтому каждая проверка ограничена таймаутом, а поток-проверка
+    # не держит завершение программы (daemon).
+    backend = backend or get_backend()
+    timeout = config.DRIVE_PROBE_TIMEOUT if timeout is None else timeout
+    try:
+        roots = backend.list_roots()
+    except Exception as e:
+        log_message(f"Не удалось получить список дисков: {e}", 'error')
+        return []
+
+    results = {root: (DRIVE_UNKNOWN, False) for root in roots}
+
+    def classify(root):
+        try:
+            drive_type = backend.drive_type(root)
+            results[root] = (drive_type, False)
+            if drive_type in config.SEARCH_DRIVE_TYPES:
+                results[root] = (drive_type, backend.probe(root))
+        except Exception as e:
+            log_message(f"Ошибка проверки диска {root}: {e}", 'debug')
+
+    threads = [threading.Thread(target=classify, args=(root,), name=f"zapret-drive-{root}", daemon=True) for root in roots]
+    for thread in threads: thread.start()
+    deadline = time.perf_counter() + timeout
+    for root, thread in zip(roots, threads):
+        thread.join(max(0, deadline - time.perf_counter()))
+        if thread.is_alive():
+            log_message(f"Диск {root} не ответил за {timeout} сек, пропускаю.", 'warning')
+    return [(root, results[root][0], results[root][1] and not thread.is_alive()) for root, thread in zip(roots, threads)]
+
+def get_search_drives(backend=None):
+    drives = classify_drives(backend)
+    summary = ", ".join(f"{root} ({drive_type}{'' if available else ', недоступен'})" for root, drive_type, available in drives)
+    log_message(f"Обнаружены диски: {summary}", 'debug')
+    return [root for root, drive_type, available in drives if available and drive_type in config.SEARCH_DRIVE_TYPES]
@@ -1,28 +1,38 @@
 import os
+import sys
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import shutil
-import zipfile
-import requests
 import time
-import tkinter as tk
-from tkinter import filedialog
-import winshell
-import string
 
 from logger_setup import log_message
 import config
-from system_ops import kill_processes_using_folder # Нужна для safe_remove_folder
+import http_client
+import tracing
+from system_ops import kill_processes_using_folder, ProcessSnapshot # Нужны для safe_remove_folder
 
-def get_drives():
-    drives = [f"{d}:\\" for d in string.ascii_uppercase if os.path.exists(f"{d}:\\")]
-    log_message(f"Обнаружены диски: {drives}", "debug")
-    return drives
+def get_app_data_dir(subdir=None):
+    appdata_path = os.getenv('LOCALAPPDATA')
+    if appdata_path:
+        base_dir = os.path.join(appdata_path, config.APP_DATA_DIR_NAME)
+    elif getattr(sys, 'frozen', False):
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(base_dir, subdir) if subdir else base_dir
+    os.makedirs(path, exist_ok=True)
+    return path
 
-def ask_for_path_dialog(title, initial_dir_key='ProgramFiles'):
+def ask_for_path_dialog(title, initial_dir_key='ProgramFiles', initial_dir=None):
     log_message(f"Запрос папки у пользователя: {title}")
+    import tkinter as tk # Тяжелый импорт, нужен только для диалога
+    from tkinter import filedialog
     root = tk.Tk()
     root.withdraw()
     root.attributes('-topmost', True)
-    initial_dir = os.getenv(initial_dir_key, 'C:\\')
+    if not initial_dir: initial_dir = os.getenv(initial_dir_key, 'C:\\')
     path = filedialog.askdirectory(title=title, initialdir=initial_dir)
     root.destroy()
     if path:
@@ -43,17 +53,18 @@ def check_write_permission(path):
          log_message("Пожалуйста, выберите другую папку или убедитесь, что у вас есть права на запись.", 'error')
          return False
 
-def safe_remove_folder(folder_path, retries=5, delay=2):
+@tracing.traced()
+def safe_remove_folder(folder_path, retries=5, delay=2, snapshot=None):
     if not os.path.exists(folder_path): return True
     log_message(f"Попытка удаления папки: {folder_path}...")
+    # Таблица процессов читается один раз и переиспользуется во всех попытках
+    snapshot = snapshot or ProcessSnapshot()
     for attempt in range(retries):
         log_message(f"Попытка {attempt + 1}/{retries} завершить процессы и удалить {folder_path}...", 'debug')
-        killed = kill_processes_using_folder(folder_path)
-        if killed > 0: time.sleep(1)
+        kill_processes_using_folder(folder_path, snapshot)
 
         try:
             shutil.rmtree(folder_path)
-            time.sleep(0.5)
             if not os.path.exists(folder_path):
                 log_message(f"Папка успешно удалена.")
                 return True
@@ -65,47 +76,273 @@ def safe_remove_folder(folder_path, retries=5, delay=2):
     log_message(f"Не удалось удалить папку {folder_path} после {retries} попыток.", 'error')
     return False
 
-def download_file(url, target_path, description=""):
-    log_message(f"Скачиваю {description} с URL: {url}")
+def _read_download_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return meta if isinstance(meta, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log_message(f"Не удалось прочитать данные для докачки {meta_path}: {e}", 'debug')
+        return {}
+
+def _write_download_meta(meta_path, meta):
+    try:
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+    except Exception as e:
+        log_message(f"Не удалось сохранить данные для докачки {meta_path}: {e}", 'debug')
+
+def _remove_partial_download(part_path, meta_path):
+    for path in (part_path, meta_path):
+        try:
+            if os.path.exists(path): os.remove(path)
+        except OSError as e:
+            log_message(f"Не удалось удалить {path}: {e}", 'debug')
+
+def _get_total_size(response, resume_from):
+    # Для ответа 206 полный размер берется из Content-Range ("bytes 100-999/1000")
+    content_range = response.headers.get('content-range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit(): return int(total)
+    content_length = int(response.headers.get('content-length', 0))
+    if not content_length: return 0
+    return content_length + resume_from if response.status_code == 206 else content_length
+
+def _hash_file(path, limit=None):
+    hasher = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(config.DOWNLOAD_CHUNK_SIZE if remaining is None else min(config.DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk: break
+            hasher.update(chunk)
+            if remaining is not None: remaining -= len(chunk)
+    return hasher
+
+def _finalize_download(part_path, meta_path, target_path, description, hasher=None, expected_sha256=None):
+    # hasher - SHA-256, посчитанный на лету при скачивании; для скачивания по частям считаем по готовому файлу
+    if hasher is None: hasher = _hash_file(part_path)
+    actual_sha256 = hasher.hexdigest()
+    if expected_sha256 and actual_sha256 != expected_sha256.lower():
+        log_message(f"Контрольная сумма {description} не совпадает: ожидалась {expected_sha256}, получена {actual_sha256}. Файл удален.", 'error')
+        _remove_partial_download(part_path, meta_path)
+        return False
+    if expected_sha256: log_message(f"Контрольная сумма {description} совпадает с опубликованной (SHA-256: {actual_sha256}).")
+    else: log_message(f"SHA-256 {description}: {actual_sha256}", 'debug')
+    os.replace(part_path, target_path)
+    _remove_partial_download(part_path, meta_path)
+    dl_size_mb = os.path.getsize(target_path)/1024/1024
+    if dl_size_mb > 0.01:
+        log_message(f"Файл {description} успешно скачан ({dl_size_mb:.2f} MB).")
+        return True
+    log_message("Размер скачанного файла подозрительно мал. Попытка не удалась.", "warning")
+    if os.path.exists(target_path): os.remove(target_path)
+    return False
+
+class _SegmentProgress:
+    def __init__(self, downloaded):
+        self.lock = threading.Lock()
+        self.downloaded = downloaded
+        self.retries = 0
+
+    def add(self, size):
+        with self.lock: self.downloaded += size
+
+def _download_segment(url, part_path, start, end, validator, progress):
+    # Возвращает True - сегмент скачан, False - не удалось, None - сервер перестал отдавать диапазоны
+    import requests
+    position = start
     for attempt in range(config.MAX_RETRIES):
         try:
-            response = requests.get(url, stream=True, timeout=120)
+            headers = {'Range': f"bytes={position}-{end}"}
+            if validator: headers['If-Range'] = validator
+            with http_client.get_session().get(url, headers=headers, stream=True, timeout=120) as response:
+                response.raise_for_status()
+                if response.status_code != 206: return None
+                with open(part_path, 'r+b') as f:
+                    f.seek(position)
+                    for chunk in response.iter_content(chunk_size=config.DOWNLOAD_CHUNK_SIZE):
+                        chunk = chunk[:end + 1 - position]
+                        f.write(chunk)
+                        position += len(chunk)
+                        progress.add(len(chunk))
+                        if position > end: break
+            if position > end: return True
+        except requests.exceptions.RequestException as e:
+            log_message(f"Ошибка сегмента {start}-{end} (попытка {attempt + 1}): {e}", 'debug')
+            with progress.lock: progress.retries += 1
+        if attempt < config.MAX_RETRIES - 1: time.sleep(config.RETRY_DELAY)
+    return False
+
+def _download_segmented(url, part_path, meta_path, description):
+    # Возвращает None, если сервер не поддерживает диапазоны или файл слишком мал (тогда качаем одним потоком)
+    if config.DOWNLOAD_SEGMENTS < 2: return None
+    import requests
+    try:
+        with http_client.get_session().head(url, allow_redirects=True, timeout=30) as response:
             response.raise_for_status()
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded_size = 0
-            log_message(f"Размер файла: {total_size / 1024 / 1024:.2f} MB" if total_size else "Размер файла неизвестен")
-            last_print_time = time.time()
-
-            with open(target_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-                    downloaded_size += len(chunk)
-                    current_time = time.time()
-                    if total_size > 0 and (current_time - last_print_time > 1 or downloaded_size == total_size):
-                        progress = downloaded_size * 100 / total_size
-                        print(f"\rСкачивание {description}: {downloaded_size // 1024} / {total_size // 1024} KB ({progress:.1f}%)", end="")
-                        last_print_time = current_time
-            print()
+            accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+            total_size = int(response.headers.get('Content-Length', 0))
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+    except (requests.exceptions.RequestException, ValueError) as e:
+        log_message(f"Не удалось проверить поддержку скачивания по частям: {e}", 'debug')
+        return None
+    if not accepts_ranges or total_size < config.SEGMENTED_DOWNLOAD_MIN_SIZE:
+        log_message("Скачивание по частям недоступно для этого файла, качаю одним потоком.", 'debug')
+        return None
 
-            dl_size_mb = os.path.getsize(target_path)/1024/1024
-            if dl_size_mb > 0.01:
-                log_message(f"Файл {description} успешно скачан ({dl_size_mb:.2f} MB).")
-                return True
+    meta = _read_download_meta(meta_path)
+    segment_size = -(-total_size // config.DOWNLOAD_SEGMENTS)
+    bounds = [(start, min(start + segment_size, total_size) - 1) for start in range(0, total_size, segment_size)]
+    same_file = (meta.get('url') == url and meta.get('total_size') == total_size and meta.get('etag') == etag
+                 and meta.get('last_modified') == last_modified and len(meta.get('segments', [])) == len(bounds))
+    if same_file and os.path.exists(part_path):
+        done = meta['segments']
+        log_message(f"Продолжаю скачивание {description} по частям: готово {sum(done)} из {len(bounds)} сегментов.")
+    else:
+        done = [False] * len(bounds)
+        with open(part_path, 'wb') as f: f.truncate(total_size)
+    meta = {'url': url, 'etag': etag, 'last_modified': last_modified, 'total_size': total_size, 'segments': done}
+    _write_download_meta(meta_path, meta)
+
+    log_message(f"Размер файла: {total_size / 1024 / 1024:.2f} MB, потоков скачивания: {len(bounds)}.")
+    already_done = sum(end - start + 1 for (start, end), ok in zip(bounds, done) if ok)
+    progress = _SegmentProgress(already_done)
+    meta_lock = threading.Lock()
+    validator = etag or last_modified
+    ranges_ignored = False
+    with ThreadPoolExecutor(max_workers=config.DOWNLOAD_SEGMENTS) as executor:
+        futures = {executor.submit(_download_segment, url, part_path, start, end, validator, progress): index
+                   for index, (start, end) in enumerate(bounds) if not done[index]}
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, timeout=1)
+            for future in finished:
+                result = future.result()
+                if result is None: ranges_ignored = True
+                if result:
+                    with meta_lock:
+                        done[futures[future]] = True
+                        _write_download_meta(meta_path, meta)
+            print(f"\rСкачивание {description}: {progress.downloaded // 1024} / {total_size // 1024} KB ({progress.downloaded * 100 / total_size:.1f}%)", end="")
+    print()
+    tracing.add_bytes(progress.downloaded - already_done)
+    tracing.add_retry(progress.retries)
+
+    if all(done): return True
+    if ranges_ignored:
+        log_message("Сервер перестал отдавать части файла. Качаю одним потоком.", 'warning')
+        _remove_partial_download(part_path, meta_path)
+        return None
+    log_message(f"Не удалось скачать {len(done) - sum(done)} из {len(done)} сегментов. Докачаю при следующей попытке.", 'error')
+    return False
+
+@tracing.traced()
+def download_file(url, target_path, description="", expected_sha256=None):
+    import requests
+    log_message(f"Скачиваю {description} с URL: {url}")
+    # Данные пишутся в .part, рядом хранится валидатор (ETag/Last-Modified) для докачки через Range
+    part_path = target_path + config.DOWNLOAD_PART_SUFFIX
+    meta_path = part_path + '.json'
+    try:
+        segmented = _download_segmented(url, part_path, meta_path, description)
+    except OSError as e:
+        log_message(f"Ошибка записи файла {description}: {e}", 'error')
+        return False
+    if segmented is not None:
+        if segmented and _finalize_download(part_path, meta_path, target_path, description, expected_sha256=expected_sha256): return True
+        log_message(f"Не удалось скачать файл {description} с {url}.", 'error')
+        return False
+
+    for attempt in range(config.MAX_RETRIES):
+        if attempt: tracing.add_retry()
+        try:
+            meta = _read_download_meta(meta_path)
+            resume_from = 0
+            headers = {}
+            hasher = None
+            if meta.get('url') == url and os.path.exists(part_path) and 'segments' not in meta:
+                validator = meta.get('etag') or meta.get('last_modified')
+                if validator:
+                    resume_from = os.path.getsize(part_path)
+            if resume_from > 0:
+                headers['Range'] = f"bytes={resume_from}-"
+                headers['If-Range'] = meta.get('etag') or meta.get('last_modified')
+
+            response = http_client.get_session().get(url, headers=headers, stream=True, timeout=120)
+            if response.status_code == 416:
+                response.close()
+                if resume_from and resume_from == meta.get('total_size'):
+                    log_message(f"Файл {description} уже был скачан полностью в прошлый раз.", 'debug')
+                    downloaded_size = total_size = resume_from
+                else:
+                    log_message("Сохраненная часть файла не подходит для докачки. Начинаю заново.", 'warning')
+                    _remove_partial_download(part_path, meta_path)
+                    continue
             else:
-                 log_message("Размер скачанного файла подозрительно мал. Попытка не удалась.", "warning")
-                 if os.path.exists(target_path): os.remove(target_path)
-                 continue
+                response.raise_for_status()
+                total_size = _get_total_size(response, resume_from)
+                if response.status_code == 206:
+                    log_message(f"Продолжаю скачивание {description} с {resume_from // 1024} KB.")
+                    file_mode = 'ab'
+                    downloaded_size = resume_from
+                    hasher = _hash_file(part_path, limit=resume_from)
+                else:
+                    if resume_from: log_message("Сервер не поддерживает докачку или файл изменился. Скачиваю заново.", 'warning')
+                    file_mode = 'wb'
+                    downloaded_size = 0
+                    hasher = hashlib.sha256()
+                    _write_download_meta(meta_path, {
+                        'url': url,
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                        'total_size': total_size,
+                    })
+                log_message(f"Размер файла: {total_size / 1024 / 1024:.2f} MB" if total_size else "Размер файла неизвестен")
+                last_print_time = time.time()
+
+                trace_span = tracing.current_span()
+                with open(part_path, file_mode) as f:
+                    for chunk in response.iter_content(chunk_size=config.DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        downloaded_size += len(chunk)
+                        trace_span.add_bytes(len(chunk))
+                        current_time = time.time()
+                        if total_size > 0 and (current_time - last_print_time > 1 or downloaded_size == total_size):
+                            progress = downloaded_size * 100 / total_size
+                            print(f"\rСкачивание {description}: {downloaded_size // 1024} / {total_size // 1024} KB ({progress:.1f}%)", end="")
+                            last_print_time = current_time
+                print()
+
+            if total_size and downloaded_size < total_size:
+                log_message(f"Соединение прервано на {downloaded_size // 1024} / {total_size // 1024} KB (попытка {attempt + 1}). Докачаю при следующей попытке.", 'warning')
+                if attempt < config.MAX_RETRIES - 1: time.sleep(config.RETRY_DELAY)
+                continue
+
+            if _finalize_download(part_path, meta_path, target_path, description, hasher, expected_sha256): return True
+            continue
         except requests.exceptions.HTTPError as e:
              log_message(f"HTTP ошибка {e.response.status_code} при скачивании {description} (попытка {attempt + 1}): {e}", 'error')
              if e.response.status_code == 404: break
         except requests.exceptions.RequestException as e:
+            print()
             log_message(f"Сетевая ошибка при скачивании {description} (попытка {attempt + 1}): {e}", 'error')
+        except OSError as e:
+            log_message(f"Ошибка записи файла {description} (попытка {attempt + 1}): {e}", 'error')
         if attempt < config.MAX_RETRIES - 1: time.sleep(config.RETRY_DELAY)
     log_message(f"Не удалось скачать файл {description} с {url}.", 'error')
     return False
 
-def unpack_and_move(zip_path, final_target_dir):
+@tracing.traced()
+def extract_archive(zip_path, final_target_dir):
+    # Возвращает (временная папка, папка с файлами для перемещения) или None при ошибке
     # Пытаемся создать временную папку рядом с final_target_dir
+    import zipfile
     try:
         base_temp_dir = os.path.dirname(final_target_dir)
         if not os.path.exists(base_temp_dir): base_temp_dir = os.getenv('TEMP', '.') # Fallback to system TEMP
@@ -119,21 +356,23 @@ def unpack_and_move(zip_path, final_target_dir):
     if os.path.exists(temp_extract_path):
         if not safe_remove_folder(temp_extract_path):
             log_message(f"Не удалось очистить временную папку распаковки {temp_extract_path}.", "error")
-            return False
+            return None
 
     try:
         os.makedirs(temp_extract_path, exist_ok=True)
+        # CRC каждого файла проверяется при распаковке (BadZipFile), отдельный проход testzip() не нужен
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
             zip_ref.extractall(temp_extract_path)
+            tracing.add_bytes(sum(info.file_size for info in zip_ref.infolist()))
         log_message("Архив успешно распакован во временную папку.")
-    except zipfile.BadZipFile:
-        log_message(f"Ошибка: Файл {zip_path} поврежден или не является ZIP-архивом.", 'error')
+    except zipfile.BadZipFile as e:
+        log_message(f"Ошибка: Файл {zip_path} поврежден или не является ZIP-архивом: {e}", 'error')
         safe_remove_folder(temp_extract_path)
-        return False
+        return None
     except Exception as e:
         log_message(f"Критическая ошибка при распаковке архива во временную папку: {e}", 'error')
         safe_remove_folder(temp_extract_path)
-        return False
+        return None
 
     source_folder = None
     extracted_items = os.listdir(temp_extract_path)
@@ -145,8 +384,10 @@ def unpack_and_move(zip_path, final_target_dir):
     else:
         log_message("Предполагаю, что архив содержит файлы напрямую в корне. Перемещаю файлы как есть.", 'debug')
         source_folder = temp_extract_path
+    return temp_extract_path, source_folder
 
-
+@tracing.traced()
+def move_extracted_files(temp_extract_path, source_folder, final_target_dir):
     log_message(f"Перемещение файлов из {source_folder} в {final_target_dir}...")
     try:
         os.makedirs(final_target_dir, exist_ok=True)
@@ -171,6 +412,141 @@ def unpack_and_move(zip_path, final_target_dir):
 
     return success
 
+@tracing.traced()
+def unpack_and_move(zip_path, final_target_dir):
+    extracted = extract_archive(zip_path, final_target_dir)
+    if not extracted: return False
+    return move_extracted_files(extracted[0], extracted[1], final_target_dir)
+
+@tracing.traced()
+def swap_directories(current_dir, staged_dir, backup_dir, snapshot=None):
+    # current_dir -> backup_dir, staged_dir -> current_dir. При ошибке возвращает все на место.
+    if os.path.exists(backup_dir) and not remove_folder_fast(backup_dir, snapshot):
+        log_message(f"Не удалось удалить оставшуюся с прошлого раза папку {backup_dir}.", 'error')
+        return False
+    for attempt in range(config.MAX_RETRIES):
+        try:
+            os.rename(current_dir, backup_dir)
+            break
+        except OSError as e:
+            log_message(f"Не удалось переименовать {current_dir} (попытка {attempt + 1}/{config.MAX_RETRIES}): {e}", 'warning')
+            if attempt == config.MAX_RETRIES - 1: return False
+            snapshot = snapshot or ProcessSnapshot()
+            kill_processes_using_folder(current_dir, snapshot)
+    try:
+        os.rename(staged_dir, current_dir)
+    except OSError as e:
+        log_message(f"Не удалось переместить новую версию на место старой: {e}. Возвращаю старую версию.", 'error')
+        try:
+            os.rename(backup_dir, current_dir)
+        except OSError as rollback_error:
+            log_message(f"Критическая ошибка: не удалось вернуть старую версию из {backup_dir}: {rollback_error}", 'critical')
+        return False
+    log_message(f"Папки переключены: {staged_dir} -> {current_dir}.", 'debug')
+    return True
+
+_tombstones_lock = threading.Lock()
+_deleting = set() # Папки, которые сейчас удаляются фоновыми потоками
+
+def _tombstones_file():
+    return os.path.join(get_app_data_dir(config.CACHE_SUBDIR), config.TOMBSTONES_FILE)
+
+def _update_tombstones(add=None, remove=None):
+    # Список переименованных, но еще не удаленных папок - чтобы дочистить их при следующем запуске
+    with _tombstones_lock:
+        try:
+            with open(_tombstones_file(), 'r', encoding='utf-8') as f:
+                tombstones = json.load(f)
+        except FileNotFoundError:
+            tombstones = []
+        except Exception as e:
+            log_message(f"Не удалось прочитать список папок на удаление: {e}", 'debug')
+            tombstones = []
+        if add and add not in tombstones: tombstones.append(add)
+        if remove in tombstones: tombstones.remove(remove)
+        try:
+            with open(_tombstones_file() + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(tombstones, f, ensure_ascii=False)
+            os.replace(_tombstones_file() + '.tmp', _tombstones_file())
+        except Exception as e:
+            log_message(f"Не удалось сохранить список папок на удаление: {e}", 'debug')
+        return list(tombstones)
+
+def _delete_tree_parallel(path):
+    # Поддеревья верхнего уровня удаляются параллельно, затем сама папка
+    with os.scandir(path) as it:
+        entries = [(entry.path, entry.is_dir(follow_symlinks=False)) for entry in it]
+    def remove(item):
+        entry_path, is_dir = item
+        if is_dir: shutil.rmtree(entry_path)
+        else: os.remove(entry_path)
+    with ThreadPoolExecutor(max_workers=max(1, config.REMOVE_WORKERS)) as executor:
+        for _ in executor.map(remove, entries): pass
+    os.rmdir(path)
+
+def _delete_tombstone(tombstone_path, freed_in=None):
+    start_time = time.perf_counter()
+    try:
+        if os.path.exists(tombstone_path): _delete_tree_parallel(tombstone_path)
+    except Exception as e:
+        log_message(f"Не удалось удалить {tombstone_path} в фоне: {e}. Повторю при следующем запуске.", 'warning')
+        return False
+    finally:
+        with _tombstones_lock: _deleting.discard(tombstone_path)
+    _update_tombstones(remove=tombstone_path)
+    elapsed = time.perf_counter() - start_time
+    if freed_in is None:
+        log_message(f"Удалена оставшаяся с прошлого запуска папка {tombstone_path} ({elapsed:.2f} сек).", 'debug')
+    else:
+        log_message(f"Фоновое удаление {tombstone_path} завершено за {elapsed:.2f} сек; путь был освобожден за {freed_in:.2f} сек, "
+                    f"на критическом пути сэкономлено {max(0.0, elapsed - freed_in):.2f} сек.", 'info')
+    return True
+
+def _start_background_delete(tombstone_path, freed_in=None):
+    # Не daemon: программа дождется окончания удаления перед выходом
+    with _tombstones_lock: _deleting.add(tombstone_path)
+    thread = threading.Thread(target=_delete_tombstone, args=(tombstone_path, freed_in), name="zapret-remove-tombstone")
+    thread.start()
+    return thread
+
+@tracing.traced()
+def remove_folder_fast(folder_path, snapshot=None):
+    # Переименовывает папку рядом (путь освобождается сразу) и удаляет ее в фоне.
+    # Если переименовать не удалось, удаляет на месте через safe_remove_folder.
+    if not os.path.exists(folder_path): return True
+    start_time = time.perf_counter()
+    folder_path = os.path.normpath(folder_path)
+    tombstone_path = f"{folder_path}{config.TOMBSTONE_SUFFIX}-{int(time.time())}-{os.getpid()}"
+    snapshot = snapshot or ProcessSnapshot()
+    for attempt in range(config.MAX_RETRIES):
+        kill_processes_using_folder(folder_path, snapshot)
+        try:
+            _update_tombstones(add=tombstone_path) # Записываем до переименования, чтобы папка не потерялась при сбое
+            os.rename(folder_path, tombstone_path)
+            break
+        except OSError as e:
+            _update_tombstones(remove=tombstone_path)
+            log_message(f"Не удалось переименовать {folder_path} для удаления (попытка {attempt + 1}/{config.MAX_RETRIES}): {e}", 'debug')
+    else:
+        log_message(f"Удаляю {folder_path} без переименования...", 'debug')
+        return safe_remove_folder(folder_path, snapshot=snapshot)
+    freed_in = time.perf_counter() - start_time
+    log_message(f"Папка {folder_path} освобождена за {freed_in:.2f} сек, удаление продолжится в фоне.", 'debug')
+    _start_background_delete(tombstone_path, freed_in)
+    return True
+
+def collect_tombstones():
+    # Дочищает папки, которые не успели удалиться в прошлый раз. Вызывается и повторно в одном процессе
+    # (режим наблюдения), поэтому папки, которые уже удаляются в фоне, пропускаются
+    threads = []
+    for tombstone_path in _update_tombstones():
+        with _tombstones_lock: deleting = tombstone_path in _deleting
+        if deleting: continue
+        if os.path.exists(tombstone_path): threads.append(_start_background_delete(tombstone_path))
+        else: _update_tombstones(remove=tombstone_path)
+    return threads
+
+@tracing.traced()
 def create_desktop_shortcut(install_dir):
     target_bat_path = os.path.join(install_dir, config.SHORTCUT_TARGET_BAT)
     if not os.path.exists(target_bat_path):
@@ -178,6 +554,7 @@ def create_desktop_shortcut(install_dir):
         return False
 
     try:
+        import winshell
         desktop_path = winshell.desktop()
         shortcut_path = os.path.join(desktop_path, config.SHORTCUT_NAME)
         log_message(f"Создание/обновление ярлыка на рабочем столе: {shortcut_path}")
@@ -196,6 +573,7 @@ def create_desktop_shortcut(install_dir):
 
 def remove_desktop_shortcut():
     try:
+        import winshell
         desktop_path = winshell.desktop()
         shortcut_path = os.path.join(desktop_path, config.SHORTCUT_NAME)
         if os.path.exists(shortcut_path):
@@ -1,33 +1,159 @@
-import requests
+import json
+import os
+import threading
 import time
-from github import Github
-from github.GithubException import RateLimitExceededException, GithubException, UnknownObjectException
 
 from logger_setup import log_message
 import config
+import filesystem
+import http_client
+import rate_limit
+import tracing
+
+_release_cache_lock = threading.Lock()
+
+class GithubAsset:
+    __slots__ = ('name', 'browser_download_url', 'size', 'digest')
+
+    def __init__(self, data):
+        self.name = data.get('name', '')
+        self.browser_download_url = data.get('browser_download_url', '')
+        self.size = data.get('size', 0)
+        self.digest = data.get('digest') # "sha256:<hex>", GitHub публикует для новых ассетов
+
+class GithubRelease:
+    # Ассеты приходят в том же ответе, что и релиз, отдельный запрос за списком не нужен
+    __slots__ = ('tag_name', '_assets')
+
+    def __init__(self, data):
+        self.tag_name = data.get('tag_name', '')
+        self._assets = [GithubAsset(asset) for asset in data.get('assets', [])]
+
+    def get_assets(self):
+        return list(self._assets)
+
+def _trim_release_data(data):
+    # Храним в кеше только то, что реально используется, чтобы файл оставался маленьким
+    return {
+        'tag_name': data.get('tag_name', ''),
+        'assets': [
+            {'name': a.get('name', ''), 'browser_download_url': a.get('browser_download_url', ''), 'size': a.get('size', 0), 'digest': a.get('digest')}
+            for a in data.get('assets', [])
+        ],
+    }
+
+def _release_cache_path():
+    return os.path.join(filesystem.get_app_data_dir(config.CACHE_SUBDIR), config.RELEASE_CACHE_FILE)
+
+def _load_release_cache():
+    try:
+        with open(_release_cache_path(), 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log_message(f"Не удалось прочитать кеш релизов: {e}", 'debug')
+        return {}
+
+def _update_release_cache(key, entry):
+    with _release_cache_lock:
+        cache = _load_release_cache()
+        cache[key] = entry
+        try:
+            cache_path = _release_cache_path()
+            tmp_path = cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            log_message(f"Не удалось сохранить кеш релизов: {e}", 'debug')
+
+@tracing.traced('release_lookup')
+def _get_release(repo_name, tag=None):
+    release_label = f"{repo_name}, {tag}" if tag else repo_name
+    trace_span = tracing.current_span()
+    trace_span.set('release', release_label)
+    cache_key = f"{repo_name}@{tag if tag else 'latest'}"
+    with _release_cache_lock:
+        cached = _load_release_cache().get(cache_key)
+
+    if cached and time.time() - cached.get('fetched_at', 0) < config.RELEASE_CACHE_TTL:
+        log_message(f"Информация о релизе ({release_label}) взята из кеша: {cached['data']['tag_name']}", 'debug')
+        trace_span.set('source', 'cache')
+        return GithubRelease(cached['data'])
+
+    import requests # Не загружаем, пока релиз берется из кеша (нужен для исключений)
+    if tag: url = f"{config.GITHUB_API_URL}/repos/{repo_name}/releases/tags/{tag}"
+    else: url = f"{config.GITHUB_API_URL}/repos/{repo_name}/releases/latest"
+    headers = {'Accept': 'application/vnd.github+json', **rate_limit.auth_headers()}
+    if cached:
+        # Условный запрос: ответ 304 не расходует лимит (для запросов с токеном) и не передает тело заново
+        if cached.get('etag'): headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'): headers['If-Modified-Since'] = cached['last_modified']
 
-def get_latest_github_release(repo_name):
-    log_message(f"Запрашиваю информацию о последнем релизе с GitHub ({repo_name})...")
-    g = Github()
     retries = config.MAX_RETRIES
     for attempt in range(retries):
-        try:
-            repo = g.get_repo(repo_name)
-            latest_release = repo.get_latest_release()
-            log_message(f"Последний релиз на GitHub ({repo_name}): {latest_release.tag_name}")
-            return latest_release
-        except RateLimitExceededException:
-            wait = config.RETRY_DELAY * (attempt + 1)
-            log_message(f"Превышен лимит запросов к GitHub API. Жду {wait} сек...", 'warning')
+        if attempt: trace_span.add_retry()
+        wait = rate_limit.seconds_until_allowed()
+        if wait > 0:
+            if cached:
+                log_message(f"Лимит запросов к GitHub API исчерпан (сброс через {wait:.0f} сек). Использую сохраненную информацию о релизе ({release_label}).", 'warning')
+                return GithubRelease(cached['data'])
+            if wait > config.RATE_LIMIT_MAX_WAIT:
+                log_message(f"Лимит запросов к GitHub API исчерпан, сброс через {wait:.0f} сек. Повторите позже "
+                            f"или укажите токен GitHub в переменной окружения {config.GITHUB_TOKEN_ENV_VARS[0]}.", 'error')
+                return None
+            log_message(f"Лимит запросов к GitHub API исчерпан. Жду {wait:.0f} сек до сброса...", 'warning')
             time.sleep(wait)
-        except UnknownObjectException:
-             log_message(f"Ошибка: Репозиторий {repo_name} не найден или не содержит релизов.", 'error')
-             return None
-        except GithubException as e:
-            log_message(f"Ошибка GitHub API ({repo_name}, попытка {attempt + 1}/{retries}): {e}", 'error')
+        try:
+            response = http_client.get_session().get(url, headers=headers, timeout=30)
+            rate_limit.update_from_response(response)
+            trace_span.add_bytes(len(response.content))
+            if response.status_code == 304 and cached:
+                log_message(f"Релиз ({release_label}) не изменился с прошлой проверки (304), использую кеш.", 'debug')
+                cached['fetched_at'] = time.time()
+                _update_release_cache(cache_key, cached)
+                return GithubRelease(cached['data'])
+            if response.status_code == 404:
+                if tag: log_message(f"Релиз с тегом {tag} не найден в {repo_name}.", 'debug')
+                else: log_message(f"Ошибка: Репозиторий {repo_name} не найден или не содержит релизов.", 'error')
+                return None
+            if rate_limit.is_rate_limited(response):
+                # Дальше решает проверка в начале цикла: кеш, ожидание сброса или отказ
+                log_message(f"Превышен лимит запросов к GitHub API ({release_label}).", 'warning')
+                continue
+            if response.status_code == 401 and rate_limit.get_token():
+                log_message("Токен GitHub отклонен (401). Проверьте токен в настройках или переменной окружения.", 'error')
+                break
+            response.raise_for_status()
+            data = _trim_release_data(response.json())
+            _update_release_cache(cache_key, {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+                'data': data,
+            })
+            return GithubRelease(data)
+        except requests.exceptions.HTTPError as e:
+            log_message(f"Ошибка GitHub API ({release_label}, попытка {attempt + 1}/{retries}): {e}", 'error')
             time.sleep(config.RETRY_DELAY)
-        except requests.exceptions.RequestException as e:
-             log_message(f"Сетевая ошибка при запросе к GitHub ({repo_name}, попытка {attempt + 1}/{retries}): {e}", 'error')
-             time.sleep(config.RETRY_DELAY)
-    log_message(f"Не удалось получить информацию о последнем релизе с GitHub ({repo_name}) после нескольких попыток.", 'error')
-    return None
\ No newline at end of file
+        except (requests.exceptions.RequestException, ValueError) as e:
+            log_message(f"Сетевая ошибка при запросе к GitHub ({release_label}, попытка {attempt + 1}/{retries}): {e}", 'error')
+            time.sleep(config.RETRY_DELAY)
+
+    if cached:
+        log_message(f"Не удалось обновить информацию о релизе ({release_label}), использую устаревший кеш.", 'warning')
+        return GithubRelease(cached['data'])
+    log_message(f"Не удалось получить информацию о релизе с GitHub ({release_label}) после нескольких попыток.", 'error')
+    return None
+
+def get_latest_github_release(repo_name):
+    log_message(f"Запрашиваю информацию о последнем релизе с GitHub ({repo_name})...")
+    release = _get_release(repo_name)
+    if release:
+        log_message(f"Последний релиз на GitHub ({repo_name}): {release.tag_name}")
+    return release
+
+def get_github_release_by_tag(repo_name, tag):
+    return _get_release(repo_name, tag)
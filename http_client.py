@@ -0,0 +1,31 @@
+import threading
+
+from logger_setup import log_message
+import config
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    # Одна сессия на весь процесс: соединения с GitHub переиспользуются (keep-alive),
+    # и TLS-рукопожатие с каждым хостом выполняется один раз, а не на каждый запрос
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_CONNECTIONS, pool_maxsize=config.HTTP_POOL_MAXSIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers['User-Agent'] = f"zapret-updater/{config.UPDATER_VERSION}"
+            _session = session
+            log_message("Создана HTTP-сессия с пулом соединений.", 'debug')
+        return _session
+
+def close_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,233 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from logger_setup import log_message, log_lazy
+import config
+import location_index
+
+def _get_temp_paths():
+    paths = []
+    for var in ('TEMP', 'TMP'):
+        value = os.getenv(var)
+        if value:
+            try: paths.append(os.path.normcase(os.path.realpath(value)))
+            except OSError: pass
+    return paths
+
+def judge_entries(path, entries):
+    # Проверка по уже прочитанному содержимому папки: ищем bin, .bat и .txt без повторного listdir.
+    # Возвращает (статус, mtime папки bin); статус - 'valid', 'near' (структура похожа, но в bin не хватает файлов) или None
+    bin_entry = None
+    has_bat = has_txt = False
+    for entry in entries:
+        name = entry.name.lower()
+        if name == 'bin':
+            if entry.is_dir(): bin_entry = entry
+        elif name.endswith('.bat'):
+            has_bat = has_bat or entry.is_file()
+        elif name.endswith('.txt'):
+            has_txt = has_txt or entry.is_file()
+    if not (bin_entry and has_bat and has_txt): return None, None
+    try:
+        bin_mtime_ns = bin_entry.stat().st_mtime_ns
+        with os.scandir(bin_entry.path) as bin_entries:
+            bin_files = {e.name.lower() for e in bin_entries if e.is_file()}
+    except OSError as e:
+        log_message(f"Ошибка чтения папки 'bin' [{bin_entry.path}]: {e}", 'debug')
+        return None, None
+    if config.BIN_ESSENTIAL_FILES.issubset(bin_files): return 'valid', bin_mtime_ns
+    log_lazy('debug', "Результат [%s]: Не все ключевые файлы найдены в bin. Отсутствуют: %s", path, config.BIN_ESSENTIAL_FILES - bin_files)
+    return 'near', bin_mtime_ns
+
+_INDEX_STATUS = {'valid': location_index.STATUS_VALID, 'near': location_index.STATUS_NEAR, None: location_index.STATUS_NONE}
+
+def _is_updater_leftover(name):
+    # Копии установки, которые создает сам обновлятор при обновлении и удалении
+    name = name.lower()
+    return any(suffix in name for suffix in (config.STAGED_DIR_SUFFIX, config.BACKUP_DIR_SUFFIX, config.TOMBSTONE_SUFFIX))
+
+def _priority(name, depth, parent_priority):
+    # Меньше - раньше. Папки с 'zapret' в имени первыми, затем вероятные места и их подпапки,
+    # затем остальное по глубине (неглубокие подпапки корня диска раньше глубоких)
+    if 'zapret' in name.lower(): return 0
+    return min(depth + 2, parent_priority + 1)
+
+class ScanResult:
+    def __init__(self):
+        self.found_path = None
+        self.candidates = []
+        self.visited = 0
+        self.reused = 0
+        self.elapsed = 0.0
+        self.timed_out = False
+        self.drive_stats = {}
+
+class _ScanState:
+    def __init__(self, roots, seeds, index):
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.queue = []
+        self.index = index
+        self.in_progress = 0
+        self.result = ScanResult()
+        self.stop = threading.Event()
+        self.temp_paths = _get_temp_paths()
+        self.start_time = time.perf_counter()
+        self.deadline = self.start_time + config.SEARCH_TIME_BUDGET
+        self.drive_started = {}
+        self.drives_over_budget = set()
+        for root in roots: self._push(root, 0, None, root, 2)
+        for seed in seeds:
+            drive = next((root for root in roots if os.path.normcase(seed).startswith(os.path.normcase(root))), seed)
+            self._push(seed, 0, None, drive, 1)
+
+    def _push(self, path, depth, mtime_ns, drive, priority):
+        heapq.heappush(self.queue, (priority, next(self.counter), path, depth, mtime_ns, drive))
+
+    def next_task(self):
+        with self.lock:
+            now = time.perf_counter()
+            if now > self.deadline:
+                self.result.timed_out = True
+                self.stop.set()
+                return None
+            while self.queue:
+                priority, _, path, depth, mtime_ns, drive = heapq.heappop(self.queue)
+                started = self.drive_started.setdefault(drive, now)
+                if now - started > config.SEARCH_DRIVE_TIME_BUDGET:
+                    if drive not in self.drives_over_budget:
+                        self.drives_over_budget.add(drive)
+                        log_message(f"Исчерпано время на диск {drive} ({config.SEARCH_DRIVE_TIME_BUDGET} сек), пропускаю остаток.", 'warning')
+                    continue
+                self.in_progress += 1
+                return path, depth, mtime_ns, drive, priority
+            if self.in_progress == 0: self.stop.set()
+            return None
+
+    def finish_task(self, task, children, reused):
+        path, depth, _, drive, priority = task
+        with self.lock:
+            self.in_progress -= 1
+            self.result.visited += 1
+            self.result.drive_stats[drive] = self.result.drive_stats.get(drive, 0) + 1
+            if reused: self.result.reused += 1
+            for child, mtime_ns in children:
+                self._push(child, depth + 1, mtime_ns, drive, _priority(os.path.basename(child), depth + 1, priority))
+
+    def report_found(self, path):
+        with self.lock:
+            if not self.result.found_path: self.result.found_path = path
+        self.stop.set()
+
+    def report_candidate(self, path, status):
+        with self.lock:
+            self.result.candidates.append((0 if status == 'near' else 1, path))
+
+def _reuse_index_record(path, depth, mtime_ns, state):
+    # Папка не менялась с прошлого сканирования: берем подпапки и результат из индекса без чтения папки.
+    # Для похожих на установку папок дополнительно сверяем mtime bin - ее содержимое могло измениться.
+    record = state.index.lookup(path, mtime_ns)
+    if not record: return None
+    if record['s'] != location_index.STATUS_NONE:
+        try:
+            if os.stat(os.path.join(path, 'bin')).st_mtime_ns != record.get('bm'): return None
+        except OSError:
+            return None
+    state.index.record(path, mtime_ns, record['c'], record['s'], record.get('bm'))
+    if record['s'] == location_index.STATUS_VALID:
+        log_message(f"Результат [{path}]: ВАЛИДНО (по индексу)", 'info')
+        state.report_found(path)
+        return []
+    if record['s'] == location_index.STATUS_NEAR: state.report_candidate(path, 'near')
+    elif 'zapret' in os.path.basename(path).lower(): state.report_candidate(path, 'name')
+    if depth >= config.SEARCH_DEPTH_LIMIT: return []
+    return [(os.path.join(path, name), None) for name in record['c']]
+
+def _scan_directory(path, depth, mtime_ns, state):
+    # Возвращает (список (подпапка, mtime или None), взято ли из индекса)
+    if state.index is not None:
+        try:
+            if mtime_ns is None: mtime_ns = os.stat(path).st_mtime_ns
+        except OSError as e:
+            log_message(f"Ошибка сканирования {path}: {e}", 'debug')
+            return [], False
+        children = _reuse_index_record(path, depth, mtime_ns, state)
+        if children is not None: return children, True
+
+    log_lazy('debug', "Скан: %s (глубина %d)", path, depth)
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError as e:
+        log_lazy('debug', "Ошибка сканирования %s: %s", path, e)
+        return [], False
+
+    status, bin_mtime_ns = None, None
+    real_path = os.path.normcase(path)
+    if not any(real_path.startswith(temp) for temp in state.temp_paths):
+        status, bin_mtime_ns = judge_entries(path, entries)
+    child_entries = [entry for entry in entries
+                     if not entry.name.startswith('.') and entry.name.lower() not in config.EXCLUDED_DIRS_SEARCH
+                     and not _is_updater_leftover(entry.name) and entry.is_dir(follow_symlinks=False)]
+    if state.index is not None:
+        # На Windows stat() у DirEntry берется из данных scandir без отдельного обращения к диску
+        children = [(entry.path, entry.stat(follow_symlinks=False).st_mtime_ns) for entry in child_entries]
+        state.index.record(path, mtime_ns, [entry.name for entry in child_entries], _INDEX_STATUS[status], bin_mtime_ns)
+    else:
+        children = [(entry.path, None) for entry in child_entries]
+
+    if status == 'valid':
+        log_message(f"Результат [{path}]: ВАЛИДНО", 'info')
+        state.report_found(path)
+        return [], False
+    if status == 'near': state.report_candidate(path, 'near')
+    elif 'zapret' in os.path.basename(path).lower(): state.report_candidate(path, 'name')
+    if depth >= config.SEARCH_DEPTH_LIMIT:
+        return [], False
+    return children, False
+
+def _worker(state):
+    while not state.stop.is_set():
+        task = state.next_task()
+        if task is None:
+            state.stop.wait(0.01)
+            continue
+        path, depth, mtime_ns = task[:3]
+        children, reused = [], False
+        try:
+            children, reused = _scan_directory(path, depth, mtime_ns, state)
+        except Exception as e:
+            log_message(f"Ошибка сканирования {path}: {e}", 'debug')
+        finally:
+            state.finish_task(task, children, reused)
+
+def get_likely_locations():
+    user_profile = os.getenv('USERPROFILE')
+    if not user_profile: return []
+    return [path for path in (os.path.join(user_profile, name) for name in config.SEARCH_LIKELY_DIRS) if os.path.isdir(path)]
+
+def scan_for_installation(roots, index=None):
+    # Обходит диски пулом потоков в порядке вероятности (очередь с приоритетом), останавливается на первой
+    # найденной установке или по истечении времени. index - LocationIndex: папки с неизменным mtime не перечитываются.
+    # Возвращает ScanResult; если установка не найдена, в candidates - лучшие найденные варианты.
+    state = _ScanState(roots, get_likely_locations(), index)
+    workers = [threading.Thread(target=_worker, args=(state,), name=f"zapret-scan-{i}", daemon=True)
+               for i in range(max(1, config.SEARCH_WORKERS))]
+    for worker in workers: worker.start()
+    for worker in workers: worker.join()
+
+    result = state.result
+    result.elapsed = time.perf_counter() - state.start_time
+    result.timed_out = result.timed_out or bool(state.drives_over_budget)
+    result.candidates = [path for _, path in sorted(result.candidates)][:config.SEARCH_MAX_CANDIDATES]
+    per_drive = ", ".join(f"{drive}: {count}" for drive, count in sorted(result.drive_stats.items()))
+    log_message(f"Сканирование дисков завершено за {result.elapsed:.2f} сек, просмотрено папок: {result.visited}"
+                f" (из индекса без чтения: {result.reused}; по дискам: {per_drive})"
+                + (", остановлено по лимиту времени." if result.timed_out else "."), 'info')
+    if index is not None:
+        if result.found_path: index.add_install(result.found_path)
+        index.save(complete=not result.found_path and not result.timed_out)
+    return result
@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+
+from logger_setup import log_message
+import config
+import filesystem
+
+# Статусы папок в индексе
+STATUS_NONE = 'n'      # Не похожа на установку
+STATUS_NEAR = 'near'   # Есть bin, .bat и .txt, но в bin не хватает ключевых файлов
+STATUS_VALID = 'ok'    # Валидная установка
+
+class LocationIndex:
+    # Индекс просканированных папок: mtime, список подпапок и результат проверки.
+    # Если mtime папки не изменился, набор ее элементов тот же, и повторно читать ее не нужно.
+    def __init__(self, index_path=None):
+        self.index_path = index_path or os.path.join(filesystem.get_app_data_dir(config.CACHE_SUBDIR), config.LOCATION_INDEX_FILE)
+        self.lock = threading.Lock()
+        self.dirs = {}
+        self.installs = []
+        self.updated = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == 1:
+                self.dirs = data.get('dirs', {})
+                self.installs = data.get('installs', [])
+                log_message(f"Загружен индекс папок: {len(self.dirs)} записей, известных установок: {len(self.installs)}.", 'debug')
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log_message(f"Не удалось прочитать индекс папок {self.index_path}: {e}", 'debug')
+
+    def lookup(self, path, mtime_ns):
+        # Возвращает запись, только если папка не менялась с прошлого сканирования
+        record = self.dirs.get(os.path.normcase(path))
+        if record and record['m'] == mtime_ns: return record
+        return None
+
+    def record(self, path, mtime_ns, children, status, bin_mtime_ns=None):
+        entry = {'m': mtime_ns, 'c': children, 's': status}
+        if bin_mtime_ns is not None: entry['bm'] = bin_mtime_ns
+        with self.lock:
+            self.updated[os.path.normcase(path)] = entry
+
+    def known_installs(self):
+        return list(self.installs)
+
+    def near_misses(self):
+        return [path for path, entry in {**self.dirs, **self.updated}.items() if entry['s'] == STATUS_NEAR]
+
+    def add_install(self, path):
+        with self.lock:
+            if path not in self.installs: self.installs.insert(0, path)
+
+    def remove_install(self, path):
+        with self.lock:
+            if path in self.installs: self.installs.remove(path)
+
+    def save(self, complete):
+        # complete=True - сканирование прошло до конца, записи о непосещенных (удаленных) папках больше не нужны
+        with self.lock:
+            if complete: self.dirs = dict(self.updated)
+            else: self.dirs.update(self.updated)
+            self.updated = {}
+            data = {'version': 1, 'installs': self.installs, 'dirs': self.dirs}
+        try:
+            with open(self.index_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(self.index_path + '.tmp', self.index_path)
+            log_message(f"Индекс папок сохранен: {len(self.dirs)} записей.", 'debug')
+        except Exception as e:
+            log_message(f"Не удалось сохранить индекс папок: {e}", 'debug')
@@ -1,12 +1,20 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 import sys
 
 logger = None
+log_dir = None
+_listener = None
+_log_queue = None
+_LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING,
+           'error': logging.ERROR, 'critical': logging.CRITICAL}
 
-def setup_logging():
-    global logger
+def setup_logging(console_stream=None):
+    # console_stream - куда выводить лог в консоли (по умолчанию stdout; в режиме командной строки - stderr)
+    global logger, log_dir, _listener, _log_queue
     if getattr(sys, 'frozen', False):
         base_dir = os.path.dirname(sys.executable)
     else:
@@ -16,7 +24,7 @@ def setup_logging():
         appdata_path = os.getenv('LOCALAPPDATA')
         if not appdata_path:
             log_dir_base = base_dir
-            print("Предупреждение: Не удалось определить папку LOCALAPPDATA. Логи будут сохраняться рядом с программой.")
+            print("Предупреждение: Не удалось определить папку LOCALAPPDATA. Логи будут сохраняться рядом с программой.", file=console_stream)
         else:
             log_dir_base = os.path.join(appdata_path, 'ZapretUpdater')
 
@@ -24,7 +32,7 @@ def setup_logging():
         os.makedirs(log_dir, exist_ok=True)
         log_file = os.path.join(log_dir, 'zapret_updater.log')
     except Exception as e:
-        print(f"Критическая ошибка настройки папки логов: {e}. Логи будут сохраняться рядом с программой.")
+        print(f"Критическая ошибка настройки папки логов: {e}. Логи будут сохраняться рядом с программой.", file=console_stream)
         log_dir = os.path.join(base_dir, 'logs')
         os.makedirs(log_dir, exist_ok=True)
         log_file = os.path.join(log_dir, 'zapret_updater.log')
@@ -35,25 +43,51 @@ def setup_logging():
     file_handler.setFormatter(log_formatter)
     file_handler.setLevel(logging.INFO)
 
-    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler = logging.StreamHandler(console_stream or sys.stdout)
     console_handler.setFormatter(log_formatter)
     console_handler.setLevel(logging.INFO)
 
+    # Запись в файл и консоль идет в отдельном потоке: вызывающий код только кладет запись в очередь.
+    # Уровень логгера совпадает с уровнем обработчиков, чтобы отбрасываемые сообщения отсекались сразу.
+    if _listener: _listener.stop()
+    _log_queue = queue.Queue()
+    _listener = logging.handlers.QueueListener(_log_queue, file_handler, console_handler, respect_handler_level=True)
+
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(min(file_handler.level, console_handler.level))
 
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
 
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+    _listener.start()
+    atexit.register(stop_logging)
+
+    print(f"Лог файл: {log_file} (Перезаписывается при каждом запуске)", file=console_stream)
+
+def flush_logs():
+    # Дождаться записи всех сообщений из очереди (перед вводом с консоли, чтобы вопрос не обогнал лог)
+    if _listener: _log_queue.join()
 
-    print(f"Лог файл: {log_file} (Перезаписывается при каждом запуске)")
+def stop_logging():
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
 
 def log_message(message, level='info'):
     if logger:
-        log_level = getattr(logging, level.upper(), logging.INFO)
-        logger.log(log_level, message)
+        log_level = _LEVELS.get(level, logging.INFO)
+        if logger.isEnabledFor(log_level): logger.log(log_level, message)
     else:
         # Fallback if logger not initialized yet
-        print(f"[{level.upper()}] {message}")
\ No newline at end of file
+        print(f"[{level.upper()}] {message}")
+
+def log_lazy(level, message_format, *args):
+    # Как log_message, но строка собирается из message_format % args, только если сообщение будет записано.
+    # Для частых отладочных сообщений: log_lazy('debug', "Скан: %s (глубина %d)", path, depth)
+    if logger:
+        log_level = _LEVELS.get(level, logging.INFO)
+        if logger.isEnabledFor(log_level): logger.log(log_level, message_format, *args)
+    else:
+        print(f"[{level.upper()}] {message_format % args if args else message_format}")
\ No newline at end of file
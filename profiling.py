@@ -0,0 +1,81 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+from logger_setup import log_message
+import config
+import tracing
+
+# Режим --profile: запуск под cProfile и tracemalloc. Результаты пишутся рядом с логом:
+# zapret_updater.prof (открывается snakeviz, pstats и т.п.) и текстовый отчет zapret_updater_profile.txt
+
+_thread_profilers_lock = threading.Lock()
+_thread_profilers = []
+
+def _start_thread_profiler(frame, event, arg):
+    # cProfile видит только поток, в котором включен. Через threading.setprofile эта функция вызывается
+    # в каждом новом потоке (поиск, предзагрузка релизов, части скачивания) и включает в нем свой профайлер
+    sys.setprofile(None)
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return # Python 3.12+: профайлер основного потока уже получает события всех потоков
+    with _thread_profilers_lock: _thread_profilers.append(profiler)
+
+def _write_report(report_path, stats, thread_count, snapshot, peak):
+    stream = io.StringIO()
+    stream.write(f"Профиль zapret_updater {config.UPDATER_VERSION}, {time.strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+    stream.write(f"=== Топ-{config.PROFILE_TOP_N} функций по общему времени ===\n")
+    if sys.version_info >= (3, 12): stream.write("Учтены все потоки (время потоков суммируется)\n")
+    else: stream.write(f"Учтены основной поток и рабочих потоков: {thread_count} (время потоков суммируется)\n")
+    stats.stream = stream
+    stats.sort_stats('cumulative').print_stats(config.PROFILE_TOP_N)
+
+    stream.write(f"\n=== Топ-{config.PROFILE_TOP_N} мест выделения памяти (на момент завершения) ===\n")
+    stream.write(f"Пик отслеживаемой памяти: {peak / 1024 / 1024:.2f} MB\n")
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                       tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")])
+    for index, stat in enumerate(snapshot.statistics('lineno')[:config.PROFILE_TOP_N], 1):
+        frame = stat.traceback[0]
+        stream.write(f"{index:>3}. {frame.filename}:{frame.lineno}: {stat.size / 1024:.1f} KB в {stat.count} блоках\n")
+
+    memory_lines = tracing.memory_report()
+    if memory_lines:
+        stream.write("\n=== Пиковая память по этапам ===\n")
+        stream.write("\n".join(memory_lines) + "\n")
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(stream.getvalue())
+
+def run_profiled(func, log_dir, *args, **kwargs):
+    log_message("Включен режим профилирования (--profile).", 'info')
+    tracemalloc.start(config.PROFILE_TRACEMALLOC_FRAMES)
+    tracing.enable_memory_tracking()
+    profiler = cProfile.Profile()
+    threading.setprofile(_start_thread_profiler)
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        # Отчет пишется и при выходе через sys.exit (самообновление) или исключение
+        profiler.disable()
+        threading.setprofile(None)
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracing.memory_peak()
+        tracing.disable_memory_tracking()
+        tracemalloc.stop()
+        prof_path = os.path.join(log_dir, 'zapret_updater.prof')
+        report_path = os.path.join(log_dir, 'zapret_updater_profile.txt')
+        try:
+            with _thread_profilers_lock: thread_profilers = list(_thread_profilers)
+            stats = pstats.Stats(profiler)
+            for thread_profiler in thread_profilers: stats.add(thread_profiler)
+            stats.dump_stats(prof_path)
+            _write_report(report_path, stats, len(thread_profilers), snapshot, peak)
+            log_message(f"Профиль сохранен: {prof_path}, отчет: {report_path}", 'info')
+        except Exception as e:
+            log_message(f"Не удалось сохранить результаты профилирования: {e}", 'error')
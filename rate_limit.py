@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+import time
+
+from logger_setup import log_message
+import config
+import filesystem
+
+# Состояние лимита запросов к GitHub API сохраняется между запусками: за одним NAT лимит анонимных
+# запросов общий для всех компьютеров, и повторные запросы после его исчерпания только продлевают ожидание
+_lock = threading.Lock()
+_state = None
+
+def get_token():
+    for var in config.GITHUB_TOKEN_ENV_VARS:
+        token = os.getenv(var)
+        if token: return token.strip()
+    return config.GITHUB_TOKEN or None
+
+def auth_headers():
+    token = get_token()
+    return {'Authorization': f"Bearer {token}"} if token else {}
+
+def _state_path():
+    return os.path.join(filesystem.get_app_data_dir(config.CACHE_SUBDIR), config.RATE_LIMIT_STATE_FILE)
+
+def _bucket():
+    # Лимиты анонимных запросов и запросов с токеном считаются отдельно
+    return 'token' if get_token() else 'anonymous'
+
+def _load_state():
+    global _state
+    if _state is None:
+        try:
+            with open(_state_path(), 'r', encoding='utf-8') as f:
+                _state = json.load(f)
+            if not isinstance(_state, dict): _state = {}
+        except FileNotFoundError:
+            _state = {}
+        except Exception as e:
+            log_message(f"Не удалось прочитать состояние лимита запросов: {e}", 'debug')
+            _state = {}
+    return _state
+
+def _save_state(state):
+    try:
+        with open(_state_path() + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(_state_path() + '.tmp', _state_path())
+    except Exception as e:
+        log_message(f"Не удалось сохранить состояние лимита запросов: {e}", 'debug')
+
+def seconds_until_allowed():
+    # 0 - запрос можно делать; иначе сколько секунд осталось до сброса лимита
+    with _lock:
+        bucket = _load_state().get(_bucket())
+    if not bucket: return 0
+    wait = bucket.get('blocked_until', 0) - time.time()
+    if bucket.get('remaining', 1) <= config.RATE_LIMIT_RESERVE:
+        wait = max(wait, bucket.get('reset', 0) - time.time())
+    return max(0, wait)
+
+def update_from_response(response):
+    # Запоминает остаток лимита из заголовков X-RateLimit-*; при 403/429 учитывает Retry-After
+    headers = response.headers
+    try:
+        remaining = int(headers['X-RateLimit-Remaining'])
+        reset = int(headers['X-RateLimit-Reset'])
+        limit = int(headers.get('X-RateLimit-Limit', 0))
+    except (KeyError, ValueError):
+        remaining, reset, limit = None, None, None
+    blocked_until = 0
+    if is_rate_limited(response) and remaining != 0:
+        # Вторичный лимит (слишком частые запросы): ждем Retry-After, а если его нет - минуту
+        try: blocked_until = time.time() + int(headers.get('Retry-After', config.RATE_LIMIT_SECONDARY_WAIT))
+        except ValueError: blocked_until = time.time() + config.RATE_LIMIT_SECONDARY_WAIT
+    if remaining is None and not blocked_until: return
+
+    with _lock:
+        state = _load_state()
+        bucket = state.setdefault(_bucket(), {})
+        if remaining is not None: bucket.update({'remaining': remaining, 'reset': reset, 'limit': limit})
+        bucket['blocked_until'] = blocked_until
+        _save_state(state)
+    if remaining is not None:
+        log_message(f"Лимит GitHub API: осталось {remaining} из {limit}, сброс в {time.strftime('%H:%M:%S', time.localtime(reset))}.", 'debug')
+
+def is_rate_limited(response):
+    if response.status_code == 429: return True
+    return response.status_code == 403 and (response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers)
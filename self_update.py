@@ -2,13 +2,14 @@ import os
 import sys
 import subprocess
 import time
-import requests
 from packaging import version as pkg_version
 
 from logger_setup import log_message
+import logger_setup
 import config
 import github_api
 import filesystem # Нужен download_file
+import tracing
 
 def perform_self_update(latest_updater_release):
     log_message("Начинаю процесс самообновления...")
@@ -98,9 +99,13 @@ exit /b 0
         return False
 
 
-def check_self_update(ask_confirmation_func):
+_NOT_FETCHED = object() # Релиз не запрашивался заранее (None - запрашивался, но получить не удалось)
+
+@tracing.traced('self_update_check')
+def check_self_update(ask_confirmation_func, latest_updater_release=_NOT_FETCHED):
     log_message(f"Текущая версия обновлятора: {config.UPDATER_VERSION}", "info")
-    latest_updater_release = github_api.get_latest_github_release(config.UPDATER_REPO)
+    if latest_updater_release is _NOT_FETCHED:
+        latest_updater_release = github_api.get_latest_github_release(config.UPDATER_REPO)
     if not latest_updater_release:
         log_message("Не удалось проверить обновления для самого обновлятора.", "warning")
         return False
@@ -122,6 +127,7 @@ def check_self_update(ask_confirmation_func):
                      return True # Возвращаем True, чтобы основной скрипт завершился
                  else:
                      log_message("Самообновление не удалось.", "error")
+                     logger_setup.flush_logs()
                      input("Нажмите Enter для продолжения со старой версией...")
                      return False # Продолжаем со старой версией
             else:
@@ -0,0 +1,146 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logger_setup import log_message
+import config
+import system_ops
+
+# Состояния служб (коды SERVICE_STATUS.dwCurrentState)
+STATE_STOPPED = 1
+STATE_START_PENDING = 2
+STATE_STOP_PENDING = 3
+STATE_RUNNING = 4
+
+# Коды ошибок sc: служба не существует, уже остановлена, помечена для удаления
+ERROR_SERVICE_DOES_NOT_EXIST = 1060
+ERROR_SERVICE_NOT_ACTIVE = 1062
+ERROR_SERVICE_MARKED_FOR_DELETE = 1072
+
+class ScBackend:
+    # Управление службами через sc.exe. Названия полей в выводе sc зависят от языка системы,
+    # поэтому разбираем только неизменяемые части: имя - первая строка блока без отступа,
+    # состояние - код и английское название (RUNNING, STOPPED и т.д.)
+    _STATE_RE = re.compile(r':\s*(\d+)\s+(?:STOPPED|START_PENDING|STOP_PENDING|RUNNING|CONTINUE_PENDING|PAUSE_PENDING|PAUSED)\b')
+
+    def query_states(self):
+        # Возвращает {имя службы в нижнем регистре: код состояния} по всем службам и драйверам за один вызов
+        return_code, stdout, _ = system_ops.run_system_command(
+            ["sc", "query", "type=", "all", "state=", "all"], "Опрос служб", log_output=False)
+        if return_code != 0 or not stdout: return None
+        states = {}
+        for block in re.split(r'\n\s*\n', stdout):
+            name, state = None, None
+            for line in block.splitlines():
+                if name is None and line and not line[0].isspace() and ':' in line:
+                    name = line.split(':', 1)[1].strip().lower()
+                elif state is None:
+                    match = self._STATE_RE.search(line)
+                    if match: state = int(match.group(1))
+            if name and state is not None: states[name] = state
+        return states
+
+    def stop(self, name):
+        return_code, _, _ = system_ops.run_system_command(["sc", "stop", name], f"Остановка {name}")
+        return return_code
+
+    def delete(self, name):
+        return_code, _, _ = system_ops.run_system_command(["sc", "delete", name], f"Удаление {name}")
+        return return_code
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None: _backend = ScBackend()
+    return _backend
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+def _stop_stages(names):
+    # Разбивает службы на этапы остановки: служба останавливается только после тех, что от нее зависят
+    remaining = list(names)
+    stages = []
+    while remaining:
+        stage = [name for name in remaining
+                 if not any(dependent in remaining for dependent in config.SERVICE_DEPENDENTS.get(name, []))]
+        if not stage: stage = list(remaining) # Циклическая зависимость в настройках - останавливаем все сразу
+        stages.append(stage)
+        remaining = [name for name in remaining if name not in stage]
+    return stages
+
+def _wait_for(backend, names, done, timeout):
+    # Опрашивает состояния, пока done(state) не выполнится для всех служб; state=None - службы нет.
+    # Возвращает список служб, не дошедших до нужного состояния за timeout
+    deadline = time.perf_counter() + timeout
+    pending = list(names)
+    while pending:
+        states = backend.query_states()
+        if states is None: return pending
+        pending = [name for name in pending if not done(states.get(name.lower()))]
+        if not pending or time.perf_counter() >= deadline: break
+        time.sleep(config.SERVICE_POLL_INTERVAL)
+    return pending
+
+def _stop_and_delete_blind(backend, names):
+    # Без опроса состояний: останавливаем и удаляем все службы из списка, как если бы они были установлены
+    success = True
+    with ThreadPoolExecutor(max_workers=len(names)) as executor:
+        for stage in _stop_stages(names):
+            for name, return_code in zip(stage, executor.map(backend.stop, stage)):
+                if return_code not in (0, ERROR_SERVICE_NOT_ACTIVE, ERROR_SERVICE_DOES_NOT_EXIST):
+                    log_message(f"Не удалось остановить службу {name} (код: {return_code}).", 'warning')
+        for name, return_code in zip(names, executor.map(backend.delete, names)):
+            if return_code not in (0, ERROR_SERVICE_DOES_NOT_EXIST, ERROR_SERVICE_MARKED_FOR_DELETE):
+                log_message(f"Не удалось удалить службу {name} (код: {return_code}).", 'error')
+                success = False
+    return success
+
+def stop_and_delete_services(names, backend=None):
+    backend = backend or get_backend()
+    start_time = time.perf_counter()
+    states = backend.query_states()
+    if states is None:
+        log_message("Не удалось получить состояние служб, останавливаю и удаляю их без проверки.", 'warning')
+        success = _stop_and_delete_blind(backend, names) if names else True
+        log_message(f"Управление службами заняло {time.perf_counter() - start_time:.2f} сек.", 'debug')
+        return success
+
+    present = [name for name in names if name.lower() in states]
+    for name in names:
+        if name not in present: log_message(f"Служба {name} не установлена, пропускаю.", 'debug')
+    if not present:
+        log_message("Службы Zapret и WinDivert не установлены.", 'info')
+        return True
+
+    success = True
+    with ThreadPoolExecutor(max_workers=len(present)) as executor:
+        for stage in _stop_stages(present):
+            running = [name for name in stage if states[name.lower()] != STATE_STOPPED]
+            if not running: continue
+            log_message(f"Останавливаю службы: {', '.join(running)}...", 'debug')
+            for name, return_code in zip(running, executor.map(backend.stop, running)):
+                if return_code not in (0, ERROR_SERVICE_NOT_ACTIVE):
+                    log_message(f"Не удалось остановить службу {name} (код: {return_code}).", 'warning')
+            not_stopped = _wait_for(backend, running, lambda state: state in (None, STATE_STOPPED), config.SERVICE_STOP_TIMEOUT)
+            if not_stopped:
+                log_message(f"Службы не остановились за {config.SERVICE_STOP_TIMEOUT} сек: {', '.join(not_stopped)}.", 'warning')
+
+        log_message(f"Удаляю службы: {', '.join(present)}...", 'debug')
+        marked = []
+        for name, return_code in zip(present, executor.map(backend.delete, present)):
+            if return_code == ERROR_SERVICE_MARKED_FOR_DELETE:
+                marked.append(name)
+            elif return_code not in (0, ERROR_SERVICE_DOES_NOT_EXIST):
+                log_message(f"Не удалось удалить службу {name} (код: {return_code}).", 'error')
+                success = False
+    # Службы, еще занятые процессами, удаляются системой позже - дольше их не ждем
+    deleted = [name for name in present if name not in marked]
+    not_deleted = _wait_for(backend, deleted, lambda state: state is None, config.SERVICE_DELETE_TIMEOUT)
+    for name in not_deleted + marked:
+        log_message(f"Служба {name} помечена для удаления и будет удалена после освобождения.", 'debug')
+
+    log_message(f"Управление службами заняло {time.perf_counter() - start_time:.2f} сек.", 'debug')
+    return success
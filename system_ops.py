@@ -1,12 +1,12 @@
 import ctypes
 import subprocess
-import psutil
 import winreg
-import time
 import os
 
-from logger_setup import log_message
+from logger_setup import log_message, log_lazy
 import config
+import services
+import tracing
 
 def is_admin():
     try:
@@ -15,16 +15,17 @@ def is_admin():
         log_message(f"Не удалось проверить права администратора: {e}", 'error')
         return False
 
-def run_system_command(command_args, command_desc):
-    log_message(f"Выполняю команду: {' '.join(command_args)} ({command_desc})...", 'debug')
+def run_system_command(command_args, command_desc, log_output=True):
+    command_line = ' '.join(command_args)
+    log_lazy('debug', "Выполняю команду: %s (%s)...", command_line, command_desc)
     try:
         result = subprocess.run(
             command_args, check=False, capture_output=True, text=True,
             encoding='cp866', errors='ignore', timeout=60, shell=True
         )
-        log_message(f"Код возврата '{' '.join(command_args)}': {result.returncode}", 'debug')
-        if result.stdout: log_message(f"Вывод '{' '.join(command_args)}':\n{result.stdout.strip()}", 'debug')
-        if result.stderr: log_message(f"Ошибка '{' '.join(command_args)}':\n{result.stderr.strip()}", 'debug')
+        log_lazy('debug', "Код возврата '%s': %s", command_line, result.returncode)
+        if result.stdout and log_output: log_lazy('debug', "Вывод '%s':\n%s", command_line, result.stdout.strip())
+        if result.stderr: log_lazy('debug', "Ошибка '%s':\n%s", command_line, result.stderr.strip())
         return result.returncode, result.stdout, result.stderr
     except subprocess.TimeoutExpired:
         log_message(f"Время ожидания выполнения '{' '.join(command_args)}' истекло.", 'error')
@@ -33,73 +34,160 @@ def run_system_command(command_args, command_desc):
         log_message(f"Неожиданная ошибка при выполнении '{' '.join(command_args)}': {e}", 'error')
         return -1, None, str(e)
 
+@tracing.traced()
 def remove_zapret_services():
     log_message("Попытка остановки и удаления служб Zapret и WinDivert...", 'info')
-    success = True
     if not is_admin():
         log_message("Ошибка: Для управления службами нужны права Администратора.", 'error')
         return False
 
-    for service_name in config.SERVICES_TO_MANAGE:
-        log_message(f"Останавливаю службу {service_name}...", 'debug')
-        return_code, _, stderr = run_system_command(["net", "stop", service_name], f"Остановка {service_name}")
-        if return_code != 0 and return_code != 2 and "не запущена" not in (stderr or "").lower() and "not started" not in (stderr or "").lower():
-            log_message(f"Не удалось остановить службу {service_name} (код: {return_code}).", 'warning')
-
-        log_message(f"Удаляю службу {service_name}...", 'debug')
-        return_code, _, stderr = run_system_command(["sc", "delete", service_name], f"Удаление {service_name}")
-        if return_code != 0 and return_code != 1060 and "не существует" not in (stderr or "").lower() and "does not exist" not in (stderr or "").lower():
-            log_message(f"Не удалось удалить службу {service_name} (код: {return_code}).", 'error')
-            success = False
-
+    success = services.stop_and_delete_services(config.SERVICES_TO_MANAGE)
     if success:
         log_message("Завершено управление службами.", 'info')
     else:
         log_message("При управлении службами возникли ошибки.", 'warning')
-    time.sleep(1)
     return success
 
-def kill_processes_using_folder(folder_path):
-    killed_count = 0
+def _normalize_path(path):
+    return os.path.normcase(os.path.realpath(path))
+
+def _is_inside(path, folder):
+    return path == folder or path.startswith(folder.rstrip(os.sep) + os.sep)
+
+_PATH_END_CHARS = (os.sep, '/', '"', "'", ' ', ';', ',')
+
+def _mentions_folder(arg, folder):
+    # Путь папки в аргументе, за которым идет разделитель, кавычка или конец строки:
+    # C:\zapret не должен совпадать с C:\zapret-old\...
+    folder = folder.rstrip(os.sep)
+    start = arg.find(folder)
+    while start != -1:
+        end = start + len(folder)
+        if end == len(arg) or arg[end] in _PATH_END_CHARS: return True
+        start = arg.find(folder, start + 1)
+    return False
+
+class ProcessSnapshot:
+    # Снимок таблицы процессов для одной операции: таблица читается при первом обращении (refresh),
+    # имя, exe и командная строка запрашиваются только у процессов, которых еще нет в снимке, а open_files
+    # (самый дорогой вызов psutil) - только у процессов, не отсеянных по exe и командной строке.
+    # Снимок можно переиспользовать между попытками удаления: refresh() читает только pid и время запуска,
+    # добавляет новые процессы, убирает завершившиеся и сбрасывает open_files - файлы могли открыть заново.
+    def __init__(self):
+        self.entries = {}
+
+    def refresh(self):
+        import psutil # Загружается при первом обращении к процессам, а не при старте
+        alive = {}
+        for proc in psutil.process_iter(['pid', 'create_time']):
+            try:
+                info = proc.info
+                key = (info['pid'], info.get('create_time'))
+                entry = self.entries.get(key)
+                if entry is None:
+                    details = proc.as_dict(['name', 'exe', 'cmdline'], ad_value=None)
+                    exe_path = details.get('exe')
+                    entry = {'proc': proc, 'pid': info['pid'], 'name': details.get('name') or '?',
+                             'exe': _normalize_path(exe_path) if exe_path else None,
+                             'cmdline': [os.path.normcase(arg) for arg in (details.get('cmdline') or [])]}
+                entry['open_files'] = None
+                alive[key] = entry
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess): continue
+            except Exception as e: log_message(f"Ошибка чтения данных процесса (PID: {proc.pid}): {e}", 'debug')
+        self.entries = alive
+        return self
+
+    def _open_files(self, entry):
+        import psutil
+        if entry['open_files'] is None:
+            try:
+                entry['open_files'] = [_normalize_path(f.path) for f in entry['proc'].open_files()]
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                entry['open_files'] = []
+            except Exception as e:
+                log_message(f"Ошибка получения открытых файлов процесса {entry['name']} (PID: {entry['pid']}): {e}", 'debug')
+                entry['open_files'] = []
+        return entry['open_files']
+
+    def _launcher_pids(self):
+        # Процессы, запустившие обновлятор (планировщик, cmd): путь установки из --install-dir есть
+        # в их командной строке, но папку они не используют
+        import psutil
+        try:
+            return {parent.pid for parent in psutil.Process().parents()}
+        except Exception:
+            return set()
+
+    def find_using_folder(self, folder_path):
+        # Возвращает [(запись процесса, причина)]; сначала дешевые проверки по exe и командной строке.
+        # Сам обновлятор не завершается никогда.
+        folder = _normalize_path(folder_path)
+        own_pid = os.getpid()
+        launcher_pids = None
+        matches = []
+        for entry in self.entries.values():
+            if entry['pid'] == own_pid: continue
+            if entry['exe'] and _is_inside(entry['exe'], folder):
+                matches.append((entry, f"запущенный из {folder_path}"))
+            elif any(_mentions_folder(arg, folder) for arg in entry['cmdline']):
+                if launcher_pids is None: launcher_pids = self._launcher_pids()
+                if entry['pid'] not in launcher_pids:
+                    matches.append((entry, f"в командной строке которого есть путь {folder_path}"))
+        matched = {id(entry) for entry, _ in matches}
+        for entry in self.entries.values():
+            if entry['pid'] == own_pid: continue
+            if id(entry) not in matched and any(_is_inside(path, folder) for path in self._open_files(entry)):
+                matches.append((entry, f"использующий файл в {folder_path}"))
+        return matches
+
+def terminate_processes(procs, timeout=None, kill_timeout=None):
+    # Сначала всем процессам сразу отправляется terminate, затем ожидание их завершения (wait_procs
+    # возвращается, как только завершились все), и только оставшимся - kill.
+    # Возвращает список процессов, которые завершить так и не удалось.
+    timeout = config.PROCESS_TERMINATE_TIMEOUT if timeout is None else timeout
+    kill_timeout = config.PROCESS_KILL_TIMEOUT if kill_timeout is None else kill_timeout
+    import psutil
+    signalled, failed = [], []
+    for proc in procs:
+        try:
+            proc.terminate()
+            signalled.append(proc)
+        except (psutil.NoSuchProcess, psutil.ZombieProcess): continue
+        except Exception as e:
+            log_message(f"Ошибка при завершении процесса (PID: {proc.pid}): {e}", 'error')
+            failed.append(proc)
+    if not signalled: return failed
+
+    _, alive = psutil.wait_procs(signalled, timeout=timeout)
+    if not alive: return failed
+    log_message(f"Не завершились за {timeout} сек: {', '.join(str(p.pid) for p in alive)}. Завершаю принудительно...", 'warning')
+    for proc in alive:
+        try: proc.kill()
+        except (psutil.NoSuchProcess, psutil.ZombieProcess): continue
+        except Exception as e: log_message(f"Ошибка при принудительном завершении процесса (PID: {proc.pid}): {e}", 'error')
+    _, alive = psutil.wait_procs(alive, timeout=kill_timeout)
+    for proc in alive:
+        log_message(f"Процесс PID {proc.pid} не удалось завершить.", 'error')
+    return failed + alive
+
+@tracing.traced()
+def kill_processes_using_folder(folder_path, snapshot=None):
+    # snapshot - ProcessSnapshot, общий для нескольких вызовов в рамках одной операции
     try:
-        folder_realpath = os.path.realpath(folder_path)
-        if not os.path.exists(folder_realpath): return 0
+        if not os.path.exists(os.path.realpath(folder_path)): return 0
     except Exception as e:
          log_message(f"Не удалось получить реальный путь для {folder_path}: {e}", "error")
          return 0
 
-    for proc in psutil.process_iter(['pid', 'name', 'open_files', 'exe', 'cmdline']):
-        try:
-            proc_info = proc.info
-            exe_path = proc_info.get('exe')
-            if exe_path and os.path.realpath(exe_path).startswith(folder_realpath):
-                 log_message(f"Обнаружен процесс {proc_info['name']} (PID: {proc_info['pid']}), запущенный из {folder_realpath}. Завершаю...", 'warning')
-                 proc.kill()
-                 killed_count += 1
-                 time.sleep(0.5)
-                 continue
-
-            open_files = proc_info.get('open_files')
-            if open_files:
-                for file_handle in open_files:
-                    try:
-                        if os.path.realpath(file_handle.path).startswith(folder_realpath):
-                            log_message(f"Обнаружен процесс {proc_info['name']} (PID: {proc_info['pid']}), использующий файл в {folder_realpath}. Завершаю...", 'warning')
-                            proc.kill()
-                            killed_count += 1
-                            time.sleep(0.5)
-                            break
-                    except Exception: pass
-                if proc.is_running():
-                    cmdline = proc_info.get('cmdline')
-                    if cmdline and any(folder_realpath in arg for arg in cmdline):
-                         log_message(f"Обнаружен процесс {proc_info['name']} (PID: {proc_info['pid']}), в командной строке которого есть путь {folder_realpath}. Завершаю...", 'warning')
-                         proc.kill()
-                         killed_count += 1
-                         time.sleep(0.5)
-
-        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess): continue
-        except Exception as e: log_message(f"Ошибка при проверке процесса {proc_info.get('name', '?')} (PID: {proc.pid}): {e}", 'error')
+    snapshot = (snapshot or ProcessSnapshot()).refresh()
+    victims = []
+    for entry, reason in snapshot.find_using_folder(folder_path):
+        log_message(f"Обнаружен процесс {entry['name']} (PID: {entry['pid']}), {reason}. Завершаю...", 'warning')
+        victims.append(entry['proc'])
+    if not victims: return 0
+
+    survivors = terminate_processes(victims)
+    killed_count = len(victims) - len(survivors)
     if killed_count > 0: log_message(f"Завершено процессов: {killed_count}.", 'info')
     return killed_count
 
@@ -0,0 +1,194 @@
+import functools
+import json
+import os
+import threading
+import time
+
+from logger_setup import log_message
+
+# Трассировка этапов работы: вложенные интервалы (span) с временем, объемом данных и числом повторов.
+# В конце запуска пишется файл в формате Chrome trace-event (открывается в chrome://tracing или Perfetto)
+# и однострочная сводка в лог.
+
+_lock = threading.Lock()
+_local = threading.local()
+_spans = []
+_origin = time.perf_counter()
+_origin_wall = time.time()
+_tracemalloc = None # Модуль tracemalloc, если включен учет памяти (режим --profile)
+_memory_peak = 0    # Наибольший пик за запуск: span сбрасывает пик tracemalloc, поэтому он копится здесь
+
+def enable_memory_tracking():
+    # Пиковая память каждого этапа (приблизительно, если этапы идут параллельно в разных потоках)
+    global _tracemalloc, _memory_peak
+    import tracemalloc
+    if not tracemalloc.is_tracing(): tracemalloc.start()
+    _tracemalloc = tracemalloc
+    _memory_peak = 0
+
+def _reset_memory_peak():
+    global _memory_peak
+    with _lock:
+        _memory_peak = max(_memory_peak, _tracemalloc.get_traced_memory()[1])
+        _tracemalloc.reset_peak()
+
+def memory_peak():
+    # Пик отслеживаемой памяти за весь запуск с учетом сбросов пика при входе в этапы
+    if not _tracemalloc: return _memory_peak
+    with _lock: return max(_memory_peak, _tracemalloc.get_traced_memory()[1])
+
+def disable_memory_tracking():
+    global _tracemalloc
+    _tracemalloc = None
+
+class Span:
+    __slots__ = ('name', 'start', 'end', 'thread_id', 'thread_name', 'depth', 'bytes', 'retries', 'args', 'mem_peak')
+
+    def __init__(self, name, depth, args):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        current = threading.current_thread()
+        self.thread_id = current.ident
+        self.thread_name = current.name
+        self.depth = depth
+        self.bytes = 0
+        self.retries = 0
+        self.args = args
+        self.mem_peak = 0
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def add_bytes(self, count):
+        self.bytes += count
+
+    def add_retry(self, count=1):
+        self.retries += count
+
+    def set(self, key, value):
+        self.args[key] = value
+
+class _NullSpan:
+    # Вне какого-либо span (например, в рабочих потоках) учет просто игнорируется
+    def add_bytes(self, count): pass
+    def add_retry(self, count=1): pass
+    def set(self, key, value): pass
+
+_null_span = _NullSpan()
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+def current_span():
+    stack = _stack()
+    return stack[-1] if stack else _null_span
+
+def add_bytes(count):
+    current_span().add_bytes(count)
+
+def add_retry(count=1):
+    current_span().add_retry(count)
+
+class span:
+    # with tracing.span('download_file', url=url) as s: ... s.add_bytes(n)
+    def __init__(self, name, **args):
+        self.name = name
+        self.args = args
+        self.span = None
+
+    def __enter__(self):
+        stack = _stack()
+        if _tracemalloc:
+            # Пик до начала вложенного этапа засчитываем родителю, затем меряем пик заново
+            if stack: stack[-1].mem_peak = max(stack[-1].mem_peak, _tracemalloc.get_traced_memory()[1])
+            _reset_memory_peak()
+        self.span = Span(self.name, len(stack), self.args)
+        stack.append(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end = time.perf_counter()
+        if exc_type is not None: self.span.args['error'] = exc_type.__name__
+        stack = _stack()
+        if stack and stack[-1] is self.span: stack.pop()
+        if _tracemalloc:
+            self.span.mem_peak = max(self.span.mem_peak, _tracemalloc.get_traced_memory()[1])
+            if stack: stack[-1].mem_peak = max(stack[-1].mem_peak, self.span.mem_peak)
+        with _lock: _spans.append(self.span)
+        return False
+
+def traced(name=None):
+    # Декоратор: весь вызов функции - один span
+    def decorator(func):
+        span_name = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _to_trace_events(spans):
+    pid = os.getpid()
+    events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'zapret_updater'}}]
+    for thread_id, thread_name in {(s.thread_id, s.thread_name) for s in spans}:
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': thread_name}})
+    for s in sorted(spans, key=lambda s: s.start):
+        args = dict(s.args)
+        if s.bytes: args['bytes'] = s.bytes
+        if s.retries: args['retries'] = s.retries
+        if s.mem_peak: args['mem_peak_kb'] = s.mem_peak // 1024
+        events.append({'name': s.name, 'cat': 'phase', 'ph': 'X', 'pid': pid, 'tid': s.thread_id,
+                       'ts': round((s.start - _origin) * 1e6), 'dur': round(s.duration * 1e6), 'args': args})
+    return events
+
+def summary_line(spans=None):
+    if spans is None:
+        with _lock: spans = list(_spans)
+    totals = {}
+    for s in spans:
+        total = totals.setdefault(s.name, [0.0, 0, 0, 0])
+        total[0] += s.duration
+        total[1] += 1
+        total[2] += s.bytes
+        total[3] += s.retries
+    parts = []
+    for name, (duration, count, byte_count, retries) in sorted(totals.items(), key=lambda item: -item[1][0]):
+        part = f"{name} {duration:.2f}с"
+        if count > 1: part += f" x{count}"
+        if byte_count: part += f" {byte_count / 1024 / 1024:.1f}MB"
+        if retries: part += f" повторов {retries}"
+        parts.append(part)
+    return f"Итог по этапам ({time.perf_counter() - _origin:.2f} сек с запуска): " + (", ".join(parts) if parts else "нет данных")
+
+def memory_report(spans=None):
+    # Строки "этап: пик памяти" в порядке убывания пика (только если включен учет памяти)
+    if spans is None:
+        with _lock: spans = list(_spans)
+    peaks = {}
+    for s in spans:
+        if s.mem_peak: peaks[s.name] = max(peaks.get(s.name, 0), s.mem_peak)
+    return [f"{name}: {peak / 1024 / 1024:.2f} MB" for name, peak in sorted(peaks.items(), key=lambda item: -item[1])]
+
+def write_trace(log_dir, file_name='zapret_updater_trace.json', clear=False):
+    # Пишет трассировку рядом с логом и выводит сводку; возвращает путь к файлу или None.
+    # clear - забыть записанные этапы (долгий режим наблюдения пишет трассировку после каждой проверки)
+    with _lock:
+        spans = list(_spans)
+        if clear: _spans.clear()
+    trace_path = os.path.join(log_dir, file_name)
+    try:
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': _to_trace_events(spans), 'displayTimeUnit': 'ms',
+                       'otherData': {'started_at': _origin_wall}}, f, ensure_ascii=False)
+    except Exception as e:
+        log_message(f"Не удалось сохранить трассировку: {e}", 'warning')
+        trace_path = None
+    log_message(summary_line(spans))
+    if trace_path: log_message(f"Трассировка сохранена: {trace_path}", 'debug')
+    return trace_path
@@ -1,14 +1,22 @@
 import os
 import time
+from packaging import version as pkg_version
 
-from logger_setup import log_message, logger
+from logger_setup import log_message, log_lazy, logger
 import config
 import system_ops
 import filesystem
 import github_api
+import delta_update
+import artifact_cache
+import install_scanner
+import location_index
+import drives
+import http_client
+import tracing
 
 def is_valid_installation(path):
-    log_message(f"Проверка папки на валидность установки Zapret: {path}", 'debug')
+    log_lazy('debug', "Проверка папки на валидность установки Zapret: %s", path)
     if not os.path.isdir(path): return False
     try:
         temp_paths = [os.path.realpath(os.getenv(var)) for var in ['TEMP', 'TMP'] if os.getenv(var)]
@@ -16,7 +24,7 @@ def is_valid_installation(path):
         is_temp = any(real_path.startswith(temp) for temp in temp_paths if temp)
         if is_temp: return False
     except Exception as e:
-        log_message(f"Предупреждение при проверке на временную папку [{path}]: {e}", 'debug')
+        log_lazy('debug', "Предупреждение при проверке на временную папку [%s]: %s", path, e)
 
     bin_path = os.path.join(path, 'bin')
     if not os.path.isdir(bin_path): return False
@@ -24,7 +32,7 @@ def is_valid_installation(path):
     try:
         bin_files = set(f.lower() for f in os.listdir(bin_path) if os.path.isfile(os.path.join(bin_path, f)))
         if not config.BIN_ESSENTIAL_FILES.issubset(bin_files):
-            log_message(f"Результат [{path}]: Не все ключевые файлы найдены в bin. Отсутствуют: {config.BIN_ESSENTIAL_FILES - bin_files}", 'debug')
+            log_lazy('debug', "Результат [%s]: Не все ключевые файлы найдены в bin. Отсутствуют: %s", path, config.BIN_ESSENTIAL_FILES - bin_files)
             return False
     except Exception as e:
         log_message(f"Ошибка чтения папки 'bin' [{bin_path}]: {e}", 'warning')
@@ -35,10 +43,10 @@ def is_valid_installation(path):
         has_bat = any(f.lower().endswith('.bat') and os.path.isfile(os.path.join(path, f)) for f in root_files)
         has_txt = any(f.lower().endswith('.txt') and os.path.isfile(os.path.join(path, f)) for f in root_files)
         if not has_bat:
-            log_message(f"Результат [{path}]: Отсутствуют .bat файлы в корневой папке", 'debug')
+            log_lazy('debug', "Результат [%s]: Отсутствуют .bat файлы в корневой папке", path)
             return False
         if not has_txt:
-            log_message(f"Результат [{path}]: Отсутствуют .txt файлы в корневой папке", 'debug')
+            log_lazy('debug', "Результат [%s]: Отсутствуют .txt файлы в корневой папке", path)
             return False
     except Exception as e:
         log_message(f"Ошибка чтения корневой папки [{path}]: {e}", 'warning')
@@ -48,12 +56,15 @@ def is_valid_installation(path):
     return True
 
 
-def ask_for_manual_search_path(ask_confirmation_func):
+def ask_for_manual_search_path(ask_confirmation_func, candidates=None):
     print("-" * 30)
+    if candidates:
+        print("Похожие папки, найденные при поиске:")
+        for candidate in candidates: print(f"  {candidate}")
     if not ask_confirmation_func("Автоматический поиск не дал результатов. Хотите указать папку вручную?"):
         log_message("Пользователь отказался указывать папку вручную.", "info")
         return None
-    manual_path = filesystem.ask_for_path_dialog("Укажите папку с установленным Zapret")
+    manual_path = filesystem.ask_for_path_dialog("Укажите папку с установленным Zapret", initial_dir=candidates[0] if candidates else None)
     if manual_path:
         log_message(f"Проверка папки, указанной вручную: {manual_path}", "info")
         if is_valid_installation(manual_path):
@@ -69,7 +80,9 @@ def ask_for_manual_search_path(ask_confirmation_func):
         log_message("Папка для ручной проверки не выбрана.", "warning")
         return None
 
-def search_installation(ask_confirmation_func):
+@tracing.traced('search_installation')
+def find_installation(candidates=None):
+    # candidates - необязательный список, в который добавляются наиболее похожие папки, если установка не найдена
     log_message("Ищу существующую установку Zapret...")
     cached_path = system_ops.load_cached_path()
     if cached_path and os.path.isdir(cached_path):
@@ -107,42 +120,40 @@ def search_installation(ask_confirmation_func):
                      log_message(f"Ошибка доступа к {common_path_base}: {e}", 'warning')
 
     log_message("Поиск в стандартных путях не дал результатов. Начинаю поиск по дискам...", 'info')
-    all_drives = filesystem.get_drives()
+    all_drives = drives.get_search_drives()
     if not all_drives:
-        log_message("Не удалось получить список дисков.", "error")
-        return ask_for_manual_search_path(ask_confirmation_func)
+        log_message("Не найдено доступных локальных дисков для поиска.", "error")
+        return None
 
-    found_path = None
-    for drive in all_drives:
-        log_message(f"Проверяю диск {drive} (глубина до {config.SEARCH_DEPTH_LIMIT})...", 'info')
-        drive_root_path = drive.rstrip(os.sep)
-        try:
-            for root, dirs, files in os.walk(drive, topdown=True):
-                dirs[:] = [d for d in dirs if not d.startswith('.') and d.lower() not in config.EXCLUDED_DIRS_SEARCH]
-                relative_path = os.path.relpath(root, drive_root_path)
-                if relative_path == '.': current_depth = 0
-                else: current_depth = relative_path.count(os.sep) + 1
-                log_message(f"Скан: {root} (глубина {current_depth})", 'debug')
-                if current_depth <= config.SEARCH_DEPTH_LIMIT:
-                    if is_valid_installation(root):
-                        log_message(f"Найдена установка (ограниченный скан): {root}")
-                        system_ops.save_cached_path(root)
-                        found_path = root
-                        break
-                if current_depth >= config.SEARCH_DEPTH_LIMIT:
-                    log_message(f"Достигнут лимит глубины в {root}.", 'debug')
-                    dirs[:] = []
-            if found_path: break
-        except Exception as e:
-             log_message(f"Ошибка сканирования {drive} в {root if 'root' in locals() else ''}: {e}", 'debug')
-             pass
+    index = location_index.LocationIndex()
+    for known_path in index.known_installs():
+        if is_valid_installation(known_path):
+            log_message(f"Найдена установка из индекса папок: {known_path}")
+            system_ops.save_cached_path(known_path)
+            return known_path
+        index.remove_install(known_path)
+
+    log_message(f"Проверяю диски {', '.join(all_drives)} (глубина до {config.SEARCH_DEPTH_LIMIT})...", 'info')
+    scan_result = install_scanner.scan_for_installation(all_drives, index)
+    found_path = scan_result.found_path
+    if not found_path and scan_result.candidates:
+        log_message(f"Возможные папки Zapret (неполная установка или похожее имя): {', '.join(scan_result.candidates)}", 'info')
+        if candidates is not None: candidates.extend(scan_result.candidates)
+    if found_path:
+        log_message(f"Найдена установка (ограниченный скан): {found_path}")
+        system_ops.save_cached_path(found_path)
 
     if found_path:
         log_message(f"Итоговый найденный путь: {found_path}")
-        return found_path
     else:
         log_message("Установка не найдена при автоматическом сканировании.", 'warning')
-        return ask_for_manual_search_path(ask_confirmation_func)
+    return found_path
+
+def search_installation(ask_confirmation_func):
+    candidates = []
+    found_path = find_installation(candidates)
+    if found_path: return found_path
+    return ask_for_manual_search_path(ask_confirmation_func, candidates)
 
 def read_version_file(version_file_path):
     data = {}
@@ -181,20 +192,52 @@ def get_current_version(installed_dir):
     log_message("Не удалось определить текущую версию ни из файла, ни из кеша.", "warning")
     return None
 
+def check_update_needed(current_version, latest_version):
+    # Возвращает (нужно ли обновление, причина для лога)
+    if not current_version:
+        return True, "текущая версия не определена"
+    if latest_version == current_version:
+        return False, f"установлена последняя версия ({current_version})"
+    try:
+        if pkg_version.parse(latest_version) > pkg_version.parse(current_version):
+            return True, f"доступна новая версия {latest_version}"
+        return False, f"установлена последняя или более новая версия ({current_version})"
+    except Exception as e:
+        log_message(f"Ошибка сравнения версий Zapret: {e}. Предлагаем обновиться.", "warning")
+        return True, "ошибка сравнения версий"
+
+
+def get_published_sha256(asset, release_assets):
+    if asset.digest and asset.digest.lower().startswith('sha256:'):
+        return asset.digest.split(':', 1)[1]
+    checksum_asset = next((a for a in release_assets if a.name.lower() == f"{asset.name.lower()}.sha256"), None)
+    if not checksum_asset:
+        log_message(f"Контрольная сумма для {asset.name} не опубликована, проверяю только целостность архива.", 'debug')
+        return None
+    try:
+        response = http_client.get_session().get(checksum_asset.browser_download_url, timeout=30)
+        response.raise_for_status()
+        checksum = response.text.split()[0].lower()
+        if len(checksum) == 64: return checksum
+        log_message(f"Некорректный формат файла {checksum_asset.name}.", 'warning')
+    except Exception as e:
+        log_message(f"Не удалось получить контрольную сумму {checksum_asset.name}: {e}", 'warning')
+    return None
 
 def download_release_zip(version_to_download, target_zip_path):
+    # Возвращает (тег релиза, имя архива, взят ли он из кеша) или False. В кеш архив сохраняет
+    # вызывающий код после успешной распаковки: здесь проверяется только центральный каталог
     release = github_api.get_latest_github_release(config.REPO_NAME)
     expected_tag = version_to_download
     if not (release and release.tag_name.lstrip('v') == expected_tag):
         log_message(f"Последний релиз не {expected_tag}, ищу по тегу...", "debug")
-        try:
-            g = github_api.Github()
-            repo = g.get_repo(config.REPO_NAME)
-            try: release = repo.get_release(f"v{expected_tag}")
-            except Exception: release = repo.get_release(expected_tag) # Пробуем без 'v'
-        except Exception as e:
-            log_message(f"Не удалось найти релиз/тег {expected_tag} на GitHub: {e}", "error")
-            return False
+        # Сначала пробуем тот вид тега, что у последнего релиза - обычно хватает одного запроса
+        tags = [f"v{expected_tag}", expected_tag]
+        if release and not release.tag_name.startswith('v'): tags.reverse()
+        release = None
+        for tag in tags:
+            release = github_api.get_github_release_by_tag(config.REPO_NAME, tag)
+            if release: break
         if not release:
             log_message(f"Релиз/тег {expected_tag} не найден.", "error")
             return False
@@ -203,7 +246,8 @@ def download_release_zip(version_to_download, target_zip_path):
     zip_asset = None
     expected_filename_v = f"zapret-discord-youtube-v{version_to_download}.zip"
     expected_filename = f"zapret-discord-youtube-{version_to_download}.zip"
-    for asset in release.get_assets():
+    assets = release.get_assets()
+    for asset in assets:
         if asset.name == expected_filename or asset.name == expected_filename_v:
             zip_asset = asset
             break
@@ -211,26 +255,27 @@ def download_release_zip(version_to_download, target_zip_path):
         log_message(f"Не найден архив в релизе {version_to_download} ({release.tag_name}).", "error")
         return False
 
-    if filesystem.download_file(zip_asset.browser_download_url, target_zip_path, f"архив Zapret {version_to_download}"):
-         log_message("Проверяю целостность скачанного архива...")
-         try:
-             with filesystem.zipfile.ZipFile(target_zip_path) as zf:
-                 bad_file = zf.testzip()
-                 if bad_file:
-                     log_message(f"Ошибка: Архив поврежден (файл: {bad_file}). Удаляю.", "error")
-                     os.remove(target_zip_path)
-                     return False
-                 else:
-                     log_message(f"Архив {version_to_download} успешно проверен.")
-                     return True
-         except Exception as e:
-              log_message(f"Ошибка проверки ZIP: {e}. Удаляю.", "error")
-              if os.path.exists(target_zip_path): os.remove(target_zip_path)
-              return False
-    else:
+    expected_sha256 = get_published_sha256(zip_asset, assets)
+    from_cache = artifact_cache.get_cached_artifact(config.REPO_NAME, release.tag_name, zip_asset.name, target_zip_path, expected_sha256)
+    if not from_cache:
+        if not filesystem.download_file(zip_asset.browser_download_url, target_zip_path, f"архив Zapret {version_to_download}", expected_sha256):
+            return False
+
+    # Читаем только центральный каталог архива; CRC файлов проверяются при распаковке
+    import zipfile
+    try:
+        with tracing.span('zip_verify'), zipfile.ZipFile(target_zip_path) as zf:
+            file_count = len(zf.infolist())
+        log_message(f"Архив {version_to_download} успешно проверен ({file_count} файлов).")
+        return release.tag_name, zip_asset.name, from_cache
+    except Exception as e:
+        log_message(f"Ошибка проверки ZIP: {e}. Удаляю.", "error")
+        if os.path.exists(target_zip_path): os.remove(target_zip_path)
+        if from_cache: artifact_cache.drop_artifact(config.REPO_NAME, release.tag_name, zip_asset.name)
         return False
 
 
+@tracing.traced()
 def perform_install_or_update(version_to_install, install_dir, is_update=False):
     action = "Обновление" if is_update else "Установка"
     log_message(f"Начинаю {action.lower()} Zapret до версии {version_to_install} в папку: {install_dir}")
@@ -243,32 +288,126 @@ def perform_install_or_update(version_to_install, install_dir, is_update=False):
         log_message(f"Ошибка создания временной папки: {e}", "critical")
         return False
 
-    if not download_release_zip(version_to_install, zip_path):
-        filesystem.safe_remove_folder(temp_download_path)
+    artifact = download_release_zip(version_to_install, zip_path)
+    if not artifact:
+        # Папку не удаляем: недокачанный .part будет продолжен при следующем запуске
+        return False
+    tag, asset_name, from_cache = artifact
+
+    if is_update and os.path.isdir(install_dir):
+        if config.UPDATE_STRATEGY == 'staged': updated = perform_staged_update(zip_path, install_dir)
+        else: updated = perform_delta_update(zip_path, install_dir)
+        if updated:
+            if not from_cache: artifact_cache.store_artifact(config.REPO_NAME, tag, asset_name, zip_path)
+            return finish_install_or_update(version_to_install, install_dir, is_update, temp_download_path)
+        if updated is None:
+            # Причина и состояние установки уже записаны в лог; архив мог быть поврежден - не берем его из кеша повторно
+            artifact_cache.drop_artifact(config.REPO_NAME, tag, asset_name)
+            return False
+        log_message("Обновление по изменениям не удалось, выполняю полную переустановку...", 'warning')
+
+    # Распаковываем до остановки служб и удаления старой версии: поврежденный архив (ошибка CRC)
+    # обнаружится здесь, пока текущая установка еще цела
+    extracted = filesystem.extract_archive(zip_path, install_dir)
+    if not extracted:
+        log_message(f"Критическая ошибка: Не удалось распаковать новую версию.", 'error')
+        if os.path.exists(zip_path): os.remove(zip_path)
+        artifact_cache.drop_artifact(config.REPO_NAME, tag, asset_name)
         return False
+    temp_extract_path, source_folder = extracted
+    # Все файлы распакованы и их CRC сошлись - архив можно класть в кеш
+    if not from_cache: artifact_cache.store_artifact(config.REPO_NAME, tag, asset_name, zip_path)
 
     if is_update:
         system_ops.remove_zapret_services()
         log_message("Завершаю процессы, использующие папку установки...")
-        system_ops.kill_processes_using_folder(install_dir)
+        snapshot = system_ops.ProcessSnapshot()
+        system_ops.kill_processes_using_folder(install_dir, snapshot)
         log_message("Удаляю старую версию...")
-        if not filesystem.safe_remove_folder(install_dir):
+        if not filesystem.remove_folder_fast(install_dir, snapshot):
             log_message("Критическая ошибка: Не удалось удалить старую версию.", 'error')
+            filesystem.safe_remove_folder(temp_extract_path)
             filesystem.safe_remove_folder(temp_download_path)
             return False
     else:
         if os.path.exists(install_dir):
-            if not filesystem.safe_remove_folder(install_dir):
+            if not filesystem.remove_folder_fast(install_dir):
                 log_message(f"Критическая ошибка: Не удалось очистить {install_dir}.", 'error')
+                filesystem.safe_remove_folder(temp_extract_path)
                 filesystem.safe_remove_folder(temp_download_path)
                 return False
 
-    if not filesystem.unpack_and_move(zip_path, install_dir):
+    if not filesystem.move_extracted_files(temp_extract_path, source_folder, install_dir):
         filesystem.safe_remove_folder(temp_download_path)
-        log_message(f"Критическая ошибка: Не удалось распаковать новую версию.", 'error')
+        log_message(f"Критическая ошибка: Не удалось установить новую версию.", 'error')
         filesystem.safe_remove_folder(install_dir)
         return False
 
+    return finish_install_or_update(version_to_install, install_dir, is_update, temp_download_path)
+
+
+@tracing.traced()
+def perform_delta_update(zip_path, install_dir):
+    plan = delta_update.plan_delta_update(zip_path, install_dir)
+    if plan is False: return None
+    if not plan: return False
+    if not (plan['added'] or plan['changed'] or plan['deleted']):
+        log_message("Файлы установки совпадают с архивом, замена не требуется.")
+        return True
+
+    staging_dir = os.path.join(os.path.dirname(install_dir), config.TEMP_SUBDIR_DELTA)
+    if not delta_update.stage_delta_files(zip_path, plan, staging_dir): return False
+
+    system_ops.remove_zapret_services()
+    log_message("Завершаю процессы, использующие папку установки...")
+    system_ops.kill_processes_using_folder(install_dir)
+    return delta_update.apply_delta_update(plan, staging_dir, install_dir) is not None
+
+
+@tracing.traced()
+def perform_staged_update(zip_path, install_dir):
+    # Возвращает True - обновлено, False - можно попробовать полную переустановку, None - текущая версия не тронута, но обновить нельзя
+    install_dir = os.path.normpath(install_dir)
+    staged_dir = install_dir + config.STAGED_DIR_SUFFIX
+    backup_dir = install_dir + config.BACKUP_DIR_SUFFIX
+
+    plan = delta_update.plan_delta_update(zip_path, install_dir)
+    if plan is False: return None
+    if plan and not (plan['added'] or plan['changed'] or plan['deleted']):
+        log_message("Файлы установки совпадают с архивом, замена не требуется.")
+        return True
+    if plan:
+        staged = delta_update.build_staged_tree(zip_path, plan, install_dir, staged_dir)
+    else:
+        if os.path.exists(staged_dir): filesystem.safe_remove_folder(staged_dir)
+        extracted = filesystem.extract_archive(zip_path, staged_dir)
+        staged = bool(extracted) and filesystem.move_extracted_files(extracted[0], extracted[1], staged_dir)
+    if not staged or not is_valid_installation(staged_dir):
+        log_message(f"Подготовленная версия в {staged_dir} некорректна.", 'error')
+        filesystem.safe_remove_folder(staged_dir)
+        log_message("Обновление отменено, текущая версия оставлена без изменений.", 'error')
+        return None
+
+    # Zapret не работает только с этого момента и до переключения папок
+    downtime_start = time.perf_counter()
+    system_ops.remove_zapret_services()
+    log_message("Завершаю процессы, использующие папку установки...")
+    snapshot = system_ops.ProcessSnapshot()
+    system_ops.kill_processes_using_folder(install_dir, snapshot)
+    if not filesystem.swap_directories(install_dir, staged_dir, backup_dir, snapshot):
+        filesystem.safe_remove_folder(staged_dir)
+        # Файлы старой версии на месте, но службы уже удалены, а процессы завершены - сам Zapret не вернется
+        log_message("Обновление отменено, файлы текущей версии оставлены без изменений.", 'error')
+        log_message("Zapret остановлен: службы удалены, процессы завершены. Запустите его вручную "
+                    "(service_install.bat от имени Администратора или general.bat).", 'warning')
+        return None
+    log_message(f"Новая версия установлена, простой Zapret составил {time.perf_counter() - downtime_start:.2f} сек.")
+    filesystem.remove_folder_fast(backup_dir)
+    return True
+
+
+def finish_install_or_update(version_to_install, install_dir, is_update, temp_download_path):
+    action = "Обновление" if is_update else "Установка"
     filesystem.create_desktop_shortcut(install_dir)
     log_message(f"Очистка временных файлов {action.lower()}...")
     filesystem.safe_remove_folder(temp_download_path)
@@ -289,6 +428,7 @@ def perform_install_or_update(version_to_install, install_dir, is_update=False):
     return True
 
 
+@tracing.traced()
 def perform_uninstall(install_dir):
     log_message(f"Начинаю удаление Zapret из папки: {install_dir}")
     if not os.path.isdir(install_dir):
@@ -298,10 +438,11 @@ def perform_uninstall(install_dir):
         return True
 
     system_ops.remove_zapret_services()
-    system_ops.kill_processes_using_folder(install_dir)
+    snapshot = system_ops.ProcessSnapshot()
+    system_ops.kill_processes_using_folder(install_dir, snapshot)
     filesystem.remove_desktop_shortcut()
 
-    if filesystem.safe_remove_folder(install_dir):
+    if filesystem.safe_remove_folder(install_dir, snapshot=snapshot):
         log_message("Папка установки успешно удалена.")
         system_ops.clear_updater_cache() # Очищаем кеш после удаления
         log_message("-" * 30)
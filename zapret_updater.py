@@ -3,7 +3,7 @@ import os
 import time
 import subprocess
 import ctypes
-from packaging import version as pkg_version
+from concurrent.futures import ThreadPoolExecutor
 import datetime
 
 import config
@@ -13,13 +13,17 @@ import system_ops
 import filesystem
 import zapret_ops
 import self_update
+import tracing
+import cli
 
-logger_setup.setup_logging()
+# В режиме командной строки лог в консоли идет в stderr, stdout остается для результата
+logger_setup.setup_logging(sys.stderr if cli.is_headless(sys.argv) else None)
 log_message = logger_setup.log_message
 
 def ask_for_user_confirmation(prompt_message):
     while True:
         try:
+            logger_setup.flush_logs()
             response = input(f"{prompt_message} (y/n): ").lower().strip()
             if response == 'y':
                 return True
@@ -41,6 +45,7 @@ def show_main_menu(installed_dir, current_version, latest_zapret_version):
         current_version = zapret_ops.get_current_version(installed_dir)
         if not current_version:
              log_message("Не удалось перечитать текущую версию Zapret.", "warning")
+        logger_setup.flush_logs() # Меню выводится через print, лог не должен перемешаться с ним
         print("\n--- Меню Управления Zapret ---")
         print(f" Установлен в: {installed_dir}")
         print(f" Текущая версия: {current_version if current_version else 'Неизвестно'}")
@@ -65,28 +70,11 @@ def show_main_menu(installed_dir, current_version, latest_zapret_version):
              return False
 
         if choice == '1':
-            update_needed = False
-            reason = "Неизвестно"
-            if not current_version:
-                update_needed = True
-                reason = "текущая версия не определена"
-            elif not latest_zapret_version:
+            if current_version and not latest_zapret_version:
                 log_message("Не удалось получить последнюю версию Zapret для сравнения.", "warning")
                 print("Не удалось проверить наличие обновлений Zapret.")
                 continue
-            elif latest_zapret_version != current_version:
-                 try:
-                     if pkg_version.parse(latest_zapret_version) > pkg_version.parse(current_version):
-                         update_needed = True
-                         reason = f"доступна новая версия {latest_zapret_version}"
-                     else:
-                         reason = f"установлена последняя или более новая версия ({current_version})"
-                 except Exception as e:
-                     log_message(f"Ошибка сравнения версий Zapret: {e}. Предлагаем обновиться.", "warning")
-                     update_needed = True
-                     reason = "ошибка сравнения версий"
-            else:
-                reason = f"установлена последняя версия ({current_version})"
+            update_needed, reason = zapret_ops.check_update_needed(current_version, latest_zapret_version)
 
             log_message(f"Результат проверки обновлений Zapret: {reason}.")
             if update_needed:
@@ -128,6 +116,7 @@ def show_main_menu(installed_dir, current_version, latest_zapret_version):
 def input_pause_or_exit(message="Нажмите Enter для продолжения..."):
     """Обертка для input(), обрабатывающая ошибки stdin."""
     try:
+        logger_setup.flush_logs()
         input(message)
     except RuntimeError as e:
         log_message(f"Ошибка input() при паузе ({e}). Продолжение без паузы.", "warning")
@@ -139,6 +128,36 @@ def input_pause_or_exit(message="Нажмите Enter для продолжен
         time.sleep(2)
 
 
+def gather_startup_info():
+    """Одновременно запрашивает релизы обновлятора и Zapret и ищет установку на дисках."""
+    durations = {}
+    candidates = []
+
+    def timed(name, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        except Exception as e:
+            log_message(f"Ошибка на этапе запуска ({name}): {e}", 'error')
+            return None
+        finally:
+            durations[name] = time.perf_counter() - start
+
+    stage_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        updater_future = executor.submit(timed, "релиз обновлятора", github_api.get_latest_github_release, config.UPDATER_REPO)
+        search_future = executor.submit(timed, "поиск установки", zapret_ops.find_installation, candidates)
+        zapret_future = executor.submit(timed, "релиз Zapret", github_api.get_latest_github_release, config.REPO_NAME)
+        updater_release = updater_future.result()
+        found_path = search_future.result()
+        zapret_release = zapret_future.result()
+    stage_time = time.perf_counter() - stage_start
+
+    details = ", ".join(f"{name}: {duration:.2f} сек" for name, duration in durations.items())
+    log_message(f"Этап запуска выполнен за {stage_time:.2f} сек (последовательно: ~{sum(durations.values()):.2f} сек; {details}).")
+    return updater_release, found_path, candidates, zapret_release
+
+
 def run_main_logic():
     log_message("-" * 50)
     log_message("Запуск установщика/обновления Zapret для Discord/YouTube")
@@ -156,14 +175,16 @@ def run_main_logic():
          time.sleep(5)
          return # Просто выход
 
-    if self_update.check_self_update(ask_for_user_confirmation):
+    filesystem.collect_tombstones()
+    updater_release, found_path, candidates, zapret_release = gather_startup_info()
+
+    if self_update.check_self_update(ask_for_user_confirmation, updater_release):
         # Самообновление запущено, текущий процесс должен завершиться
         # Не вызываем здесь input_pause_or_exit, т.к. скрипт должен тихо умереть
         sys.exit(0)
 
-    installed_dir = zapret_ops.search_installation(ask_for_user_confirmation)
+    installed_dir = found_path or zapret_ops.ask_for_manual_search_path(ask_for_user_confirmation, candidates)
 
-    zapret_release = github_api.get_latest_github_release(config.REPO_NAME)
     latest_zapret_version = zapret_release.tag_name.lstrip('v') if zapret_release else None
 
     if not installed_dir:
@@ -213,9 +234,12 @@ def run_main_logic():
 
 if __name__ == "__main__":
     elevated_param = '--elevated'
+    profile_param = '--profile' # cProfile + tracemalloc, отчеты пишутся рядом с логом
+    # Команды check/update/repair/uninstall: без вопросов, диалогов и пауз, права проверяет сама команда
+    headless = cli.is_headless(sys.argv)
 
     # --- Блок запроса прав Администратора ---
-    if elevated_param not in sys.argv and not system_ops.is_admin():
+    if not headless and elevated_param not in sys.argv and not system_ops.is_admin():
         log_message("Для работы требуются права Администратора.", 'warning')
         log_message("Запрос на повышение прав (UAC)...", 'info')
         print("Запрашиваю права администратора (UAC)...") # Сообщение пользователю
@@ -260,7 +284,7 @@ if __name__ == "__main__":
         log_message("Скрипт перезапущен с правами администратора.", 'info')
     elif system_ops.is_admin():
          log_message("Скрипт уже запущен с правами администратора.", 'info')
-    else:
+    elif not headless:
          # Эта ветка не должна выполняться, если логика выше верна
          log_message("Критическая ошибка: Не удалось получить права администратора после проверки.", "critical")
          print("Критическая ошибка: Не удалось получить права администратора.")
@@ -268,9 +292,30 @@ if __name__ == "__main__":
          sys.exit(1)
 
 
+    profile_enabled = profile_param in sys.argv
+    if profile_enabled: sys.argv.remove(profile_param)
+
+    if headless:
+        exit_code = cli.EXIT_ERROR
+        try:
+            with tracing.span('run'):
+                if profile_enabled:
+                    import profiling
+                    exit_code = profiling.run_profiled(cli.run, logger_setup.log_dir, sys.argv[1:])
+                else:
+                    exit_code = cli.run(sys.argv[1:])
+        finally:
+            tracing.write_trace(logger_setup.log_dir)
+        sys.exit(exit_code)
+
     # --- Запуск основной логики ---
     try:
-        run_main_logic()
+        with tracing.span('run'):
+            if profile_enabled:
+                import profiling
+                profiling.run_profiled(run_main_logic, logger_setup.log_dir)
+            else:
+                run_main_logic()
     except Exception as e:
         log_message("Произошла критическая непредвиденная ошибка:", 'critical')
         if logger_setup.logger: logger_setup.logger.exception(e)
@@ -279,6 +324,9 @@ if __name__ == "__main__":
         # Пауза перед выходом в случае критической ошибки
         input_pause_or_exit("Нажмите Enter для закрытия окна...")
         sys.exit(1) # Завершение с кодом ошибки
+    finally:
+        # Сводка по этапам и файл трассировки рядом с логом (в т.ч. при выходе после самообновления)
+        tracing.write_trace(logger_setup.log_dir)
 
 
     # --- Завершение работы ---